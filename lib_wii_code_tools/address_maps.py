@@ -1,7 +1,8 @@
+import bisect
 import dataclasses
 import enum
 import re
-from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
 from . import common
 
@@ -101,9 +102,67 @@ class AddressMapper:
         return self._mappings_sorted_reverse
 
 
+    _mapping_starts = None
+    @property
+    def mapping_starts(self) -> List[int]:
+        if self._mapping_starts is None:
+            self._mapping_starts = [m.start for m in self.mappings_sorted]
+        return self._mapping_starts
+
+
+    _mapping_starts_reverse = None
+    @property
+    def mapping_starts_reverse(self) -> List[int]:
+        if self._mapping_starts_reverse is None:
+            self._mapping_starts_reverse = [m.start + m.delta for m in self.mappings_sorted_reverse]
+        return self._mapping_starts_reverse
+
+
+    _mapping_max_ends_reverse = None
+    @property
+    def mapping_max_ends_reverse(self) -> List[int]:
+        """
+        The highest end address (in self's address space) of
+        mappings_sorted_reverse[:i + 1], for each i
+        """
+        if self._mapping_max_ends_reverse is None:
+            max_ends = []
+            max_end = -1
+            for m in self.mappings_sorted_reverse:
+                max_end = max(max_end, m.end + m.delta)
+                max_ends.append(max_end)
+            self._mapping_max_ends_reverse = max_ends
+        return self._mapping_max_ends_reverse
+
+
     def _invalidate_sorted_mappings(self) -> None:
         self._mappings_sorted = None
         self._mappings_sorted_reverse = None
+        self._mapping_starts = None
+        self._mapping_starts_reverse = None
+        self._mapping_max_ends_reverse = None
+
+
+    def _find_mapping_reverse(self, address: int) -> Optional[Mapping]:
+        """
+        Find a mapping that covers address in self's address space,
+        without using the interval tree
+        """
+        # Mappings can overlap in this direction, so the last one to
+        # start at or before the address isn't necessarily the one that
+        # covers it -- an earlier, longer one might. Walk backwards until
+        # none of the remaining ones reach far enough.
+        mappings = self.mappings_sorted_reverse
+        max_ends = self.mapping_max_ends_reverse
+
+        i = bisect.bisect_right(self.mapping_starts_reverse, address) - 1
+        while i >= 0 and address <= max_ends[i]:
+            mapping = mappings[i]
+            if address <= mapping.end + mapping.delta:
+                return mapping
+            i -= 1
+
+        return None
 
 
     def add_mapping(self, start: int, end: int, delta: int) -> None:
@@ -141,19 +200,10 @@ class AddressMapper:
 
         else:
             # Fallback slow path
-            mappings = self.mappings_sorted
-
-            low = 0
-            high = len(mappings) - 1
-            while low <= high:
-                mid = (low + high) // 2
-
-                mapping = mappings[mid]
-                if address < mapping.start:
-                    high = mid - 1
-                elif address > mapping.end:
-                    low = mid + 1
-                else:
+            i = bisect.bisect_right(self.mapping_starts, address) - 1
+            if i >= 0:
+                mapping = self.mappings_sorted[i]
+                if address <= mapping.end:
                     return address + mapping.delta
 
         return self.handle_unmapped(address, error_handling)
@@ -167,29 +217,146 @@ class AddressMapper:
 
         if IntervalTree is not None:
             result_set = self.itree_backwards[address]
-            if result_set:
+            if len(result_set) == 1:
                 return address - next(iter(result_set)).data.delta
+            elif result_set:
+                # Ambiguous -- pick the same one _find_mapping_reverse()
+                # would, so the result doesn't depend on whether
+                # intervaltree is installed
+                mappings = self.mappings_sorted_reverse
+                interval = max(result_set, key=lambda interval: mappings.index(interval.data))
+                return address - interval.data.delta
 
         else:
             # Fallback slow path
-            mappings = self.mappings_sorted_reverse
-
-            low = 0
-            high = len(mappings) - 1
-            while low <= high:
-                mid = (low + high) // 2
-
-                mapping = mappings[mid]
-                if address < mapping.start + mapping.delta:
-                    high = mid - 1
-                elif address > mapping.end + mapping.delta:
-                    low = mid + 1
-                else:
-                    return address - mapping.delta
+            mapping = self._find_mapping_reverse(address)
+            if mapping is not None:
+                return address - mapping.delta
 
         return self.handle_unmapped(address, error_handling, reverse_map=True)
 
 
+    def remap_many(self, addresses: Iterable[int], *, error_handling=None) -> List[Optional[int]]:
+        """
+        Map many addresses from self.base to self at once.
+        Equivalent to calling remap_single() on each one, but much faster
+        for large batches (e.g. entire symbol maps).
+        """
+        # (Mappings can't overlap in self.base's address space, so a
+        # binary search always finds the same mapping the interval tree
+        # would, and is faster than querying it)
+        mappings = self.mappings_sorted
+        starts = self.mapping_starts
+        bisect_right = bisect.bisect_right
+
+        remapped = []
+        append = remapped.append
+        for address in addresses:
+            if address is None:
+                append(None)
+                continue
+
+            i = bisect_right(starts, address) - 1
+            if i >= 0 and address <= mappings[i].end:
+                append(address + mappings[i].delta)
+            else:
+                append(self.handle_unmapped(address, error_handling))
+
+        return remapped
+
+
+    def remap_many_reverse(self, addresses: Iterable[int], *, error_handling=None) -> List[Optional[int]]:
+        """
+        Map many addresses from self to self.base at once.
+        Equivalent to calling remap_single_reverse() on each one, but
+        much faster for large batches (e.g. entire symbol maps).
+        """
+        # (Mappings can overlap in self's address space, so this goes
+        # through _find_mapping_reverse() rather than a plain binary
+        # search)
+        find_mapping_reverse = self._find_mapping_reverse
+
+        remapped = []
+        append = remapped.append
+        for address in addresses:
+            if address is None:
+                append(None)
+                continue
+
+            mapping = find_mapping_reverse(address)
+            if mapping is not None:
+                append(address - mapping.delta)
+            else:
+                append(self.handle_unmapped(address, error_handling, reverse_map=True))
+
+        return remapped
+
+
+    def _remap_runs(self, start: int, stop: int, error_handling, reverse_map: bool) -> List[Tuple[int, int, Optional[int]]]:
+        """
+        Shared implementation of remap_runs() and remap_runs_reverse()
+        """
+        if reverse_map:
+            starts = self.mapping_starts_reverse
+        else:
+            mappings = self.mappings_sorted
+            starts = self.mapping_starts
+
+        runs = []
+        address = start
+        while address < stop:
+            # Same lookup as remap_many() / remap_many_reverse(), but
+            # then figure out how far its result stays the same
+            i = bisect.bisect_right(starts, address) - 1
+            next_start = starts[i + 1] if i + 1 < len(starts) else stop
+
+            if reverse_map:
+                # (The covering mapping might start before mappings[i],
+                # but the result still can't change until it ends or
+                # another one begins)
+                mapping = self._find_mapping_reverse(address)
+                if mapping is not None:
+                    run_stop = min(stop, mapping.end + mapping.delta + 1, next_start)
+                    delta = -mapping.delta
+            else:
+                mapping = mappings[i] if i >= 0 else None
+                if mapping is not None and address <= mapping.end:
+                    run_stop = min(stop, mapping.end + 1, next_start)
+                    delta = mapping.delta
+                else:
+                    mapping = None
+
+            if mapping is None:
+                run_stop = min(stop, next_start)
+                mapped = self.handle_unmapped(address, error_handling, reverse_map=reverse_map)
+                delta = None if mapped is None else mapped - address
+
+            runs.append((address, run_stop, delta))
+            address = run_stop
+
+        return runs
+
+
+    def remap_runs(self, start: int, stop: int, *, error_handling=None) -> List[Tuple[int, int, Optional[int]]]:
+        """
+        Map the range of addresses [start, stop) from self.base to self,
+        as a list of (run_start, run_stop, delta) tuples covering the
+        range, with delta being None for dropped addresses.
+        Equivalent to calling remap_many() on the whole range, except
+        that error_handling only reports the first address of each
+        unmapped run.
+        """
+        return self._remap_runs(start, stop, error_handling, False)
+
+
+    def remap_runs_reverse(self, start: int, stop: int, *, error_handling=None) -> List[Tuple[int, int, Optional[int]]]:
+        """
+        Map the range of addresses [start, stop) from self to self.base,
+        in the same format as remap_runs().
+        """
+        return self._remap_runs(start, stop, error_handling, True)
+
+
     def remap(self, address: int, *, error_handling=None) -> int:
         """
         Map an address from default to self
@@ -466,6 +633,85 @@ def map_addr_from_to(
     return address
 
 
+def map_addrs_from_to(
+        mapper_from: AddressMapper,
+        mapper_to: AddressMapper,
+        addresses: Iterable[int],
+        *, error_handling=None) -> List[Optional[int]]:
+    """
+    Map many addresses from one AddressMapper to another at once.
+    Equivalent to calling map_addr_from_to() on each one, but much
+    faster for large batches.
+    """
+    addresses = list(addresses)
+
+    lca = lowest_common_ancestor(mapper_from, mapper_to)
+
+    # Map the addresses backwards to the LCA
+    current = mapper_from
+    while current is not lca:
+        addresses = current.remap_many_reverse(addresses, error_handling=error_handling)
+        current = current.base
+
+    # Map the addresses forwards from the LCA
+    chain = []
+    current = mapper_to
+    while current is not lca:
+        chain.append(current)
+        current = current.base
+    for current in reversed(chain):
+        addresses = current.remap_many(addresses, error_handling=error_handling)
+
+    return addresses
+
+
+def map_range_from_to(
+        mapper_from: AddressMapper,
+        mapper_to: AddressMapper,
+        start: int,
+        stop: int,
+        *, error_handling=None) -> List[Tuple[int, int, Optional[int]]]:
+    """
+    Map the range of addresses [start, stop) from one AddressMapper to
+    another, as a list of (run_start, run_stop, delta) tuples covering
+    the range (see AddressMapper.remap_runs()).
+    Equivalent to calling map_addrs_from_to() on the whole range, but
+    doesn't need to touch each address individually.
+    """
+    lca = lowest_common_ancestor(mapper_from, mapper_to)
+
+    # Steps backwards to the LCA, and then forwards from it
+    steps = []
+    current = mapper_from
+    while current is not lca:
+        steps.append(current.remap_runs_reverse)
+        current = current.base
+    chain = []
+    current = mapper_to
+    while current is not lca:
+        chain.append(current.remap_runs)
+        current = current.base
+    steps.extend(reversed(chain))
+
+    runs = [(start, stop, 0)]
+    for step in steps:
+        new_runs = []
+        for run_start, run_stop, delta in runs:
+            if delta is None:
+                new_runs.append((run_start, run_stop, None))
+                continue
+
+            for sub_start, sub_stop, sub_delta in step(run_start + delta, run_stop + delta, error_handling=error_handling):
+                new_runs.append((
+                    sub_start - delta,
+                    sub_stop - delta,
+                    None if sub_delta is None else delta + sub_delta))
+
+        runs = new_runs
+
+    return runs
+
+
 def iter_natural_chrono_order(map: AddressMap) -> Iterator[Tuple[str, AddressMapper]]:
     """
     Iterate over AddressMappers in a breadth-first-search-type order,
@@ -491,3 +737,48 @@ def iter_natural_chrono_order(map: AddressMap) -> Iterator[Tuple[str, AddressMap
         next_layer = set()
         for mapper in this_layer:
             next_layer |= base_names_to_children[name_for_mapper(mapper)]
+
+
+def main():
+    # Two mappings whose images overlap in the reverse direction.
+    # 0x300 is only covered by the first one, even though the second
+    # one is the last to start before it.
+    mapper = AddressMapper()
+    mapper.add_mapping(0x1000, 0x1FFF, -0xF00)  # -> 0x100-0x10FF
+    mapper.add_mapping(0x2000, 0x200F, -0x1E00)  # -> 0x200-0x20F
+
+    drop = UnmappedAddressHandling(common.ErrorVolume.SILENT, UnmappedAddressHandling.Behavior.DROP)
+
+    TESTS = [
+        (0xFF, None),
+        (0x100, 0x1000),
+        (0x1FF, 0x10FF),
+        (0x200, 0x2000),
+        (0x20F, 0x200F),
+        (0x210, 0x1110),
+        (0x300, 0x1200),
+        (0x10FF, 0x1FFF),
+        (0x1100, None),
+    ]
+
+    print('Running tests...')
+    for address, expected in TESTS:
+        print(f'Reverse-mapping {address:08X}', end=' -> ')
+        result = mapper.remap_single_reverse(address, error_handling=drop)
+        print('(unmapped)' if result is None else f'{result:08X}')
+        if result != expected:
+            raise AssertionError('Test failed!')
+
+    # The batch versions have to agree
+    if mapper.remap_many_reverse([address for address, expected in TESTS], error_handling=drop) != [expected for address, expected in TESTS]:
+        raise AssertionError('Test failed! (remap_many_reverse)')
+    for address, expected in TESTS:
+        [(run_start, run_stop, delta)] = mapper.remap_runs_reverse(address, address + 1, error_handling=drop)
+        if (None if delta is None else address + delta) != expected:
+            raise AssertionError('Test failed! (remap_runs_reverse)')
+
+    print('All tests passed!')
+
+
+if __name__ == '__main__':
+    main()
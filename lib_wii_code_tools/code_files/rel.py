@@ -35,8 +35,11 @@ class RELSection(CodeFileSection):
         if file_offset == 0:
             self.data = None
         else:
+            # (Loaded as a bytearray, so that relocations can be
+            # applied to it in-place)
             file.seek(SEGMENT_OFF(file_offset))
-            self.data = file.read(size)
+            self.data = bytearray(size)
+            del self.data[file.readinto(self.data):]
 
         self.is_executable = bool(file_offset & 1)
 
@@ -71,33 +74,53 @@ class RELRelocationType(enum.IntEnum):
     R_DOLPHIN_MRKREF = 204
 
 
+RELOCATION_STRUCT = struct.Struct('>HBBI')
+
+
 class RELRelocation:
     """
     Represents a relocation in a .rel file
     """
-    offset: int = 0
-    type: RELRelocationType = RELRelocationType.R_PPC_NONE
-    section: int = 0
-    addend: int = 0
+    # (There can be a *lot* of these, so __slots__ keeps them small)
+    __slots__ = ('offset', 'type', 'section', 'addend')
+
+    offset: int
+    type: RELRelocationType
+    section: int
+    addend: int
+
+    def __init__(self, offset: int = 0, type: RELRelocationType = RELRelocationType.R_PPC_NONE, section: int = 0, addend: int = 0):
+        self.offset = offset
+        self.type = type
+        self.section = section
+        self.addend = addend
+
+    @classmethod
+    def from_values(cls, offset: int, type: int, section: int, addend: int) -> 'RELRelocation':
+        """
+        Create a relocation from the raw values of its fields
+        """
+        return cls(offset, RELRelocationType(type), section, addend)
 
     @classmethod
     def from_file(cls, file: BinaryIO, offs: int) -> 'RELRelocation':
         """
         Load a relocation from the given offset in the given file
         """
-        self = cls()
-
         file.seek(offs)
-        self.offset, type, self.section, self.addend = struct.unpack_from('>HBBI', file.read(8))
-        self.type = RELRelocationType(type)
+        return cls.from_values(*RELOCATION_STRUCT.unpack_from(file.read(8)))
 
-        return self
+
+# Number of relocations to read from the file at once
+RELOCATIONS_READ_CHUNK_SIZE = 0x200
 
 
 class RELImport:
     """
     Represents an imp-table entry in a .rel file
     """
+    __slots__ = ('module_num', 'relocations')
+
     module_num: int
     relocations: list
 
@@ -114,12 +137,28 @@ class RELImport:
         file.seek(offs)
         self.module_num, reloc_offset = struct.unpack_from('>II', file.read(8))
 
-        for i in range(99999):
-            reloc = RELRelocation.from_file(file, reloc_offset + i * 8)
-            self.relocations.append(reloc)
-            if reloc.type == RELRelocationType.R_DOLPHIN_END:
+        # The table's length isn't stored anywhere, so read it in
+        # chunks (rather than one relocation at a time) until
+        # R_DOLPHIN_END turns up
+        file.seek(reloc_offset)
+
+        max_relocations = 99999
+        found_end = False
+        while not found_end and len(self.relocations) < max_relocations:
+            num_to_read = min(RELOCATIONS_READ_CHUNK_SIZE, max_relocations - len(self.relocations))
+            chunk = file.read(num_to_read * RELOCATION_STRUCT.size)
+            chunk = chunk[:len(chunk) - len(chunk) % RELOCATION_STRUCT.size]
+            if not chunk:
                 break
-        else:
+
+            for values in RELOCATION_STRUCT.iter_unpack(chunk):
+                reloc = RELRelocation.from_values(*values)
+                self.relocations.append(reloc)
+                if reloc.type == RELRelocationType.R_DOLPHIN_END:
+                    found_end = True
+                    break
+
+        if not found_end:
             print("WARNING: couldn't find the end of the imp table")
 
         return self
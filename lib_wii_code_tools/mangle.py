@@ -3,6 +3,8 @@
 # mangle.py
 # CodeWarrior mangler, by CLF78 and RoadrunnerWMC
 
+import re
+
 
 TYPE_ENDINGS = {
     '*',
@@ -20,6 +22,12 @@ PREPEND_KEYWORDS = [
     'friend',
 ]
 
+# Matches one of the above at the start of a return type
+PREPEND_KEYWORDS_REGEX = re.compile(r'^(?:' + '|'.join(map(re.escape, PREPEND_KEYWORDS)) + r')\s+')
+
+# Matches runs of whitespace, for collapsing them into single spaces
+WHITESPACE_REGEX = re.compile(r'\s+')
+
 DECORS = {
     '*': 'P',
     '&': 'R',
@@ -103,9 +111,12 @@ def renumerate(data: list):
 
 
 class _Mangler:
+    __slots__ = ('is_templated_function', 'is_remangle_mode', 'type_cache')
+
     def __init__(self, is_remangle_mode: bool):
         self.is_templated_function = False
         self.is_remangle_mode = is_remangle_mode
+        self.type_cache = {}
 
 
     def apply_changes(self, func: str, typedefs: dict[str, str], substitutions: dict[str, str]) -> str:
@@ -304,8 +315,9 @@ class _Mangler:
 
         # Split and mangle the args
         func_args = self.split_args(func_args)
+        mangle_type = self.mangle_type
         for arg in func_args:
-            mangled_func += self.mangle_type(arg)
+            mangled_func += mangle_type(arg)
 
         # Mangle the return type
         mangled_func += f'_{self.mangle_type(func_return)}'
@@ -316,6 +328,22 @@ class _Mangler:
 
     def mangle_type(self, type: str, no_length: bool = False) -> str:
 
+        # Function names aren't cached, since mangling one can mark the function as templated
+        if no_length:
+            return self.mangle_type_uncached(type, True)
+
+        # Long symbols tend to repeat the same types over and over, so only mangle each one once
+        # CodeWarrior has no back-reference scheme, so the output itself still repeats them in full
+        mangled_type = self.type_cache.get(type)
+        if mangled_type is None:
+            mangled_type = self.mangle_type_uncached(type)
+            self.type_cache[type] = mangled_type
+
+        return mangled_type
+
+
+    def mangle_type_uncached(self, type: str, no_length: bool = False) -> str:
+
         # Initialize type
         mangled_type = ''
 
@@ -452,6 +480,7 @@ class _Mangler:
         pieces = []
         curr_nest_level = 0
         prev_component_idx = 0
+        type_len = len(type)
 
         # Iterate through the string and split by non-nested :: characters
         for i, c in enumerate(type):
@@ -462,8 +491,8 @@ class _Mangler:
             elif c == '>' or c == ')':
                 curr_nest_level -= 1
 
-            # Detect name splits
-            elif type[i:i+2] == '::' and curr_nest_level == 0:
+            # Detect name splits (without slicing, since this runs for every character)
+            elif c == ':' and i + 1 < type_len and type[i+1] == ':' and curr_nest_level == 0:
 
                 # Prevent series of more than two :: characters
                 if i <= prev_component_idx:
@@ -498,8 +527,9 @@ class _Mangler:
             mangled_types += f'Q{len(types)}'
 
         # Mangle each piece
+        mangle_type = self.mangle_type
         for type in types:
-            mangled_types += self.mangle_type(type)
+            mangled_types += mangle_type(type)
 
         # Return result
         return mangled_types
@@ -572,7 +602,7 @@ class _Mangler:
 
         # Apply typedefs and substitutions and strip excess whitespace
         func = self.apply_changes(func, typedefs, substitutions)
-        func = ' '.join(func.split())
+        func = WHITESPACE_REGEX.sub(' ', func).strip()
 
         # Bail on any array argument
         if '[' in func or ']' in func:
@@ -609,8 +639,8 @@ class _Mangler:
             return func_name
 
         # Remove all keywords from the return type
-        for keyword in PREPEND_KEYWORDS:
-            func_ret = func_ret.replace(f'{keyword} ', '').strip()
+        while match := PREPEND_KEYWORDS_REGEX.match(func_ret):
+            func_ret = func_ret[match.end():]
 
         # Prepare the final string
         mangled_name = ''
@@ -621,8 +651,9 @@ class _Mangler:
 
         # Split the arguments and mangle them
         split_args = self.split_args(func_args)
+        mangle_arg = self.mangle_arg
         for arg in split_args:
-            mangled_name += self.mangle_arg(arg)
+            mangled_name += mangle_arg(arg)
 
         # If the function is templated, add the mangled return type too
         if self.is_templated_function:
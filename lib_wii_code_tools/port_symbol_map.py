@@ -1,4 +1,6 @@
-from typing import Callable, Dict, List, Tuple
+import enum
+import functools
+from typing import Callable, Dict, List, Optional, Tuple
 
 from . import common
 from . import tweaks as lib_tweaks
@@ -27,14 +29,29 @@ class PortingIssuesHandling:
             self.tweaks_errors = tweaks_errors
 
 
+class TweaksError(enum.Enum):
+    """
+    Kinds of errors that can be encountered while tweaking symbols. The
+    values are format strings for the error messages.
+    """
+    DELETION_NAME_MISMATCH = 'tried to delete "{0}" from {1:08X}, but it was actually called "{2}"'
+    DELETION_NOT_FOUND = 'did not find "{0}" at {1:08X} to delete'
+    RENAME_ADDRESS_MISMATCH = 'tried to rename "{0}" at {1:08X}, but the remapped address "{2}" was expected to be "{3}"'
+    RENAME_NAME_MISMATCH = 'tried to rename "{0}" at {1:08X}, but it was expected to be called "{2}"'
+    ADDITION_COLLISION = 'tried to add "{0}" at {1:08X}, but there\'s already a symbol there ("{2}")'
+    COLLISION = 'multiple symbols map to {0:08X}: "{1}", "{2}"'
+
+
 def handle_tweaks_error_list(
-    error_list: List[str],
+    error_list: List[Tuple],
     error_handling: PortingIssuesHandling,
     map_from_name: str,
     map_to_name: str,
 ) -> None:
     """
-    Handle a list of errors (strings) encountered while tweaking symbols
+    Handle a list of errors encountered while tweaking symbols. Each
+    error is a tuple of a TweaksError and the values to format its
+    message with.
     """
     if error_handling is None:
         error_handling = PortingIssuesHandling()
@@ -42,15 +59,16 @@ def handle_tweaks_error_list(
     if error_handling.tweaks_errors == ErrorVolume.SILENT:
         return
 
+    # (Messages are only formatted here, since in silent mode they'd
+    # just be thrown away)
+    error_list = [error.value.format(*args) for error, *args in error_list]
+
     type_name = 'Warning' if error_handling.tweaks_errors == ErrorVolume.WARNING else 'Error'
 
     if len(error_list) == 1:
-        msg_list = [f'{type_name} [{map_from_name} -> {map_to_name}]: {error_list[0]}']
+        msg = f'{type_name} [{map_from_name} -> {map_to_name}]: {error_list[0]}'
     else:
-        msg_list = [f'{type_name}s [{map_from_name} -> {map_to_name}]:']
-        msg_list.extend('- ' + e for e in error_list)
-
-    msg = '\n'.join(msg_list)
+        msg = f'{type_name}s [{map_from_name} -> {map_to_name}]:\n' + '\n'.join(['- ' + e for e in error_list])
 
     if error_handling.tweaks_errors == ErrorVolume.ERROR:
         raise ValueError(msg)
@@ -62,7 +80,7 @@ def remap_symbols_one_level(
     map_from_name: str,
     map_to_name: str,
     map: lib_symbol_map_formats.BasicSymbolMap,
-    address_map_func: Callable[[int], int],
+    address_map_func: Callable[[List[int]], List[Optional[int]]],
     additions: lib_symbol_map_formats.BasicSymbolMap,
     deletions: lib_symbol_map_formats.BasicSymbolMap,
     renames: Dict[int, Tuple[int, str, str]],
@@ -75,28 +93,81 @@ def remap_symbols_one_level(
     the mappers graph; note that the signature doesn't even involve
     mappers at all.
 
-    address_map_func should be a callable that converts addresses to the
-        new mapping.
+    address_map_func should be a callable that converts a list of
+        addresses to the new mapping, returning a list of the same length
+        (with None for any that should be dropped).
     additions is a dict of new symbols to add: {addr: name, ...}
     deletions is a dict of symbols to delete: {addr: name, ...}
     renames is a dict of symbols to rename:
         {addr: (expected_remapped_addr, old_name, new_name), ...}
     """
+    if error_handling is None:
+        error_handling = PortingIssuesHandling()
+
+    # Don't bother collecting errors if they won't be shown anyway
+    report_errors = error_handling.tweaks_errors != ErrorVolume.SILENT
+
     error_list = []
 
+    # Fast path for the common case where there are no tweaks to apply,
+    # so the only thing that can go wrong is a collision
+    if not additions and not deletions and not renames:
+        remapped_addrs = address_map_func(list(map))
+
+        # (Building the dict in one go like this keeps the whole loop in
+        # C. Dropped symbols all end up under a single None key, which is
+        # then removed.)
+        remapped = dict(zip(remapped_addrs, map.values()))
+        remapped.pop(None, None)
+
+        # If no symbols collided, that's all there is to it
+        if len(remapped) == len(remapped_addrs) - remapped_addrs.count(None):
+            return remapped
+
+        # Otherwise, go through them again more carefully, so that the
+        # first symbol at each address wins and the rest are reported
+        remapped = {}
+        for name, remapped_addr in zip(map.values(), remapped_addrs):
+            if remapped_addr is None:
+                continue
+
+            if remapped_addr in remapped:
+                if report_errors:
+                    error_list.append((TweaksError.COLLISION, remapped_addr, remapped[remapped_addr], name))
+            else:
+                remapped[remapped_addr] = name
+
+        if error_list:
+            handle_tweaks_error_list(error_list, error_handling, map_from_name, map_to_name)
+
+        return remapped
+
+    # Remap all of the addresses in one batch up front, rather than one
+    # call per symbol. (Symbols that will be deleted are left out.)
+    remapped_addrs = iter(address_map_func([addr for addr in map if addr not in deletions]))
+
+    # Bind these to locals, since they're used for every symbol
+    deletions_get = deletions.get
+    renames_get = renames.get
+    error_list_append = error_list.append
+
+    # (Keep track of deletions separately instead of removing them from
+    # the dict, so that the caller's dict isn't modified)
+    seen_deletions = set()
+
     remapped = {}
     for addr, name in map.items():
         # Check if this symbol is marked for deletion; skip if so
-        deletions_name = deletions.get(addr)
-        if deletions_name:
-            if name != deletions_name:
-                error_list.append(f'tried to delete "{deletions_name}" from {addr:08X}, but it was actually called "{name}"')
+        deletions_name = deletions_get(addr)
+        if deletions_name is not None:
+            if name != deletions_name and report_errors:
+                error_list_append((TweaksError.DELETION_NAME_MISMATCH, deletions_name, addr, name))
 
-            del deletions[addr]
+            seen_deletions.add(addr)
             continue
 
         # Get the remapped address
-        remapped_addr = address_map_func(addr)
+        remapped_addr = next(remapped_addrs)
 
         # If it's None, then the address can't be mapped and the user
         # elected to drop such symbols. So, skip.
@@ -104,33 +175,39 @@ def remap_symbols_one_level(
             continue
 
         # Handle renaming info
-        rename_info = renames.get(addr)
-        if rename_info:
+        rename_info = renames_get(addr)
+        if rename_info is not None:
             expected_remapped_addr, old_name, new_name = rename_info
             if expected_remapped_addr != remapped_addr:
-                error_list.append(f'tried to rename "{name}" at {addr:08X}, but the remapped address "{remapped_addr}" was expected to be "{expected_remapped_addr}"')
+                if report_errors:
+                    error_list_append((TweaksError.RENAME_ADDRESS_MISMATCH, name, addr, remapped_addr, expected_remapped_addr))
                 continue
             if old_name != name:
-                error_list.append(f'tried to rename "{name}" at {addr:08X}, but it was expected to be called "{old_name}"')
+                if report_errors:
+                    error_list_append((TweaksError.RENAME_NAME_MISMATCH, name, addr, old_name))
                 continue
 
             name = new_name
 
         if remapped_addr in remapped:
-            error_list.append(f'multiple symbols map to {remapped_addr:08X}: "{remapped[remapped_addr]}", "{name}"')
+            if report_errors:
+                error_list_append((TweaksError.COLLISION, remapped_addr, remapped[remapped_addr], name))
         else:
             remapped[remapped_addr] = name
 
     # Add new symbols
     for addr, name in additions.items():
         if addr in remapped:
-            error_list.append(f'tried to add "{name}" at {addr:08X}, but there\'s already a symbol there ("{remapped[addr]}")')
+            if report_errors:
+                error_list.append((TweaksError.ADDITION_COLLISION, name, addr, remapped[addr]))
             continue
         remapped[addr] = name
 
     # Ensure that we deleted everything we were supposed to
-    for addr, name in deletions.items():
-        error_list.append(f'did not find "{name}" at {addr:08X} to delete')
+    if report_errors:
+        for addr, name in deletions.items():
+            if addr not in seen_deletions:
+                error_list.append((TweaksError.DELETION_NOT_FOUND, name, addr))
 
     # If there were errors, show them
     if error_list:
@@ -155,15 +232,15 @@ def remap_symbols_one_level_down(
     if mapper_to.base is not mapper_from:
         raise ValueError('must remap symbols forwards from parent to child')
 
-    address_map_func = lambda a: mapper_to.remap_single(a, error_handling=error_handling.unmapped_addresses)
-    additions_dict = {a.address: a.name for a in tweaks.additions}
-    deletions_dict = {d.address: d.name for d in tweaks.deletions}
-    renames_dict = {r.address_from: (r.address_to, r.name_from, r.name_to) for r in tweaks.renames}
+    if error_handling is None:
+        error_handling = PortingIssuesHandling()
+
+    address_map_func = functools.partial(mapper_to.remap_many, error_handling=error_handling.unmapped_addresses)
 
     return remap_symbols_one_level(
         name_for_mapper(mapper_from), name_for_mapper(mapper_to),
         map, address_map_func,
-        additions_dict, deletions_dict, renames_dict,
+        tweaks.additions_dict, tweaks.deletions_dict, tweaks.renames_dict,
         error_handling=error_handling,
     )
 
@@ -184,26 +261,82 @@ def remap_symbols_one_level_up(
     if mapper_from.base is not mapper_to:
         raise ValueError('must remap symbols backwards from child to parent')
 
-    address_map_func = lambda a: mapper_from.remap_single_reverse(a, error_handling=error_handling.unmapped_addresses)
+    if error_handling is None:
+        error_handling = PortingIssuesHandling()
+
+    address_map_func = functools.partial(mapper_from.remap_many_reverse, error_handling=error_handling.unmapped_addresses)
 
     # Since we're moving backwards, we want to *delete* symbols that
     # the tweaker says should be added, and *add* ones it says to
     # delete. That is, we need to swap deletions and additions.
-    additions_dict = {d.address: d.name for d in tweaks.deletions}
-    deletions_dict = {a.address: a.name for a in tweaks.additions}
-
     # We also swap the "to" and "from" fields in the renames, for the
     # same reason.
-    renames_dict = {r.address_to: (r.address_from, r.name_to, r.name_from) for r in tweaks.renames}
-
     return remap_symbols_one_level(
         name_for_mapper(mapper_from), name_for_mapper(mapper_to),
         map, address_map_func,
-        additions_dict, deletions_dict, renames_dict,
+        tweaks.deletions_dict, tweaks.additions_dict, tweaks.renames_dict_reversed,
         error_handling=error_handling,
     )
 
 
+def remap_symbols_to_one_version(
+    map: lib_symbol_map_formats.BasicSymbolMap,
+    start_mapper_name: str,
+    target_mapper_name: str,
+    mappers: lib_address_maps.AddressMap,
+    tweaks: lib_tweaks.SymbolsTweakMap,
+    *,
+    error_handling: PortingIssuesHandling = None,
+    verbose: bool = False,
+) -> lib_symbol_map_formats.BasicSymbolMap:
+    """
+    Remap a symbol table dictionary to one other version, going only
+    through the versions on the path between the two
+    """
+    for name in (start_mapper_name, target_mapper_name):
+        if name not in mappers:
+            raise ValueError(f'"{name}" is not in the address map')
+
+    def path_to_root(name: str) -> List[str]:
+        path = [name]
+        while name != 'default':
+            name = name_for_mapper(mappers[name].base)
+            path.append(name)
+        return path
+
+    # The path goes backwards from the start mapper up to the lowest
+    # common ancestor of the two mappers, and then forwards from there
+    # down to the target mapper
+    up_path = path_to_root(start_mapper_name)
+    down_path = path_to_root(target_mapper_name)
+
+    up_path_set = set(up_path)
+    lca_index = next(i for i, name in enumerate(down_path) if name in up_path_set)
+
+    up_path = up_path[:up_path.index(down_path[lca_index]) + 1]
+    down_path = down_path[lca_index::-1]
+
+    for current_name, parent_name in zip(up_path, up_path[1:]):
+        if verbose:
+            print(f'    Remapping from "{current_name}" backwards to "{parent_name}"...')
+
+        map = remap_symbols_one_level_up(
+            mappers[current_name], mappers[parent_name], map,
+            tweaks.get(current_name, tweaks['default']),
+            error_handling=error_handling)
+
+    for parent_name, current_name in zip(down_path, down_path[1:]):
+        if verbose:
+            print(f'    Remapping from "{parent_name}" forwards to "{current_name}"...')
+
+        map = remap_symbols_one_level_down(
+            mappers[parent_name], mappers[current_name], map,
+            tweaks.get(current_name, tweaks['default']),
+            error_handling=error_handling)
+
+    return map
+
+
 def remap_symbols_to_all_versions(
     map: lib_symbol_map_formats.BasicSymbolMap,
     start_mapper_name: str,
@@ -212,10 +345,18 @@ def remap_symbols_to_all_versions(
     *,
     error_handling: PortingIssuesHandling = None,
     verbose: bool = False,
+    only_target: Optional[str] = None,
 ) -> Dict[str, lib_symbol_map_formats.BasicSymbolMap]:
     """
-    Remap a symbol table dictionary to all other versions
+    Remap a symbol table dictionary to all other versions.
+    If only_target is set, only that version is remapped to (along the
+    shortest path), and it'll be the only one in the returned dict.
     """
+    if only_target is not None:
+        return {only_target: remap_symbols_to_one_version(
+            map, start_mapper_name, only_target, mappers, tweaks,
+            error_handling=error_handling, verbose=verbose)}
+
     # (No remapping to do for the version the map is initially for)
     remapped_syms = {start_mapper_name: map}
 
@@ -224,14 +365,45 @@ def remap_symbols_to_all_versions(
     # mapper to be the parent of all nodes with .base == None, the DAG
     # is more specifically a tree.
 
-    # List off the children for each mapper
+    # Look up each mapper's parent name once, and use that to list off
+    # the children for each mapper
+    parent_name = {name: name_for_mapper(mapper.base) for name, mapper in mappers.items() if name != 'default'}
     mapper_children = {name: [] for name in mappers}
-    for name, mapper in mappers.items():
-        if name == 'default': continue
-        mapper_children[name_for_mapper(mapper.base)].append(name)
+    for name, parent in parent_name.items():
+        mapper_children[parent].append(name)
+
+    def remap_down_from(name: str) -> None:
+        """
+        Remap symbols from the given (already-remapped) mapper down to
+        all of its descendants that haven't been remapped yet
+        """
+        stack = [name]
+        while stack:
+            parent = mappers[stack.pop()]
+            for child_name in mapper_children[parent.name]:
+                # (Children that were already remapped are on the path
+                # back to the root, and get handled separately)
+                if child_name in remapped_syms:
+                    continue
+
+                current = mappers[child_name]
+
+                if verbose:
+                    print(f'    Remapping from "{parent.name}" forwards to "{current.name}"...')
+
+                remapped_syms[current.name] = remap_symbols_one_level_down(
+                    parent, current, remapped_syms[parent.name],
+                    tweaks.get(current.name, tweaks['default']),
+                    error_handling=error_handling)
+
+                stack.append(child_name)
+
+    # We remap the symbols backwards from the start mapper to the root,
+    # which is the shortest path to each of those mappers. Along the
+    # way, as soon as each mapper on that path is done, we also remap
+    # forwards from it into all of its other subtrees.
+    remap_down_from(start_mapper_name)
 
-    # First, we remap the symbols backwards from the start mapper to the
-    # root. This is the shortest path to each of those mappers.
     current = mappers[start_mapper_name]
     while current.name != 'default':
         parent = current.base if current.base else mappers['default']
@@ -244,34 +416,9 @@ def remap_symbols_to_all_versions(
             tweaks.get(current.name, tweaks['default']),
             error_handling=error_handling)
 
-        current = parent
-
-    # Next, we remap from each of those mappers down to their children,
-    # recursively.
-
-    # Start by initializing the work list with the names of the mappers
-    # we can map to right away
-    able_to_map_down_to = []
-    for name, mapper in mappers.items():
-        if name_for_mapper(mapper.base) in remapped_syms and name not in remapped_syms:
-            able_to_map_down_to.append(name)
-
-    # Now use the work list to remap the symbols forwards until there
-    # are no mappers left
-    while able_to_map_down_to:
-        current = mappers[able_to_map_down_to.pop()]
-        parent = current.base if current.base else mappers['default']
-
-        if verbose:
-            print(f'    Remapping from "{parent.name}" forwards to "{current.name}"...')
+        remap_down_from(parent.name)
 
-        remapped_syms[current.name] = remap_symbols_one_level_down(
-            parent, current, remapped_syms[parent.name],
-            tweaks.get(current.name, tweaks['default']),
-            error_handling=error_handling)
-
-        # And remap to its children, too
-        able_to_map_down_to.extend(mapper_children[current.name])
+        current = parent
 
     # Make sure we got everything
     # This should always be true unless there's a bug in this function
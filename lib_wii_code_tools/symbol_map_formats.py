@@ -121,15 +121,23 @@ class SymbolMap:
 
 
     @classmethod
-    def autodetect(cls, f: TextIO) -> bool:
+    def try_load(cls, f: TextIO) -> Optional['SymbolMap']:
         """
-        Try to infer if the file is in this symbol map format or not
+        Try to read from a file-like object, returning None if it's not
+        in this symbol map format
         """
         try:
-            cls.load(f)
+            return cls.load(f)
         except Exception:
-            return False
-        return True
+            return None
+
+
+    @classmethod
+    def autodetect(cls, f: TextIO) -> bool:
+        """
+        Try to infer if the file is in this symbol map format or not
+        """
+        return cls.try_load(f) is not None
 
 
     def __str__(self)-> str:
@@ -749,20 +757,30 @@ def autodetect_and_load(f: TextIO) -> SymbolMap:
     """
     Auto-detect the symbol map format, and load a SymbolMap
     """
-    options = set()
+    # Detecting a format means fully loading the file in that format, so
+    # hang onto the results instead of loading it all over again after
+    options = {}
     for name, cls in FORMAT_CLASSES.items():
         if cls.LOADABLE:
             f.seek(0)
-            if cls.autodetect(f):
-                options.add(name)
+            map_obj = cls.try_load(f)
+            if map_obj is not None:
+                options[name] = map_obj
 
     if not options:
         raise ValueError('Unrecognized symbol map format')
     elif len(options) > 1:
         raise ValueError(f'Uncertain symbol map format: could be {", ".join(options)}')
 
-    f.seek(0)
-    return FORMAT_CLASSES[next(iter(options))].load(f)
+    return next(iter(options.values()))
+
+
+def autodetect_and_load_as_dict(f: TextIO) -> BasicSymbolMap:
+    """
+    Auto-detect the symbol map format, and load it as a simple
+    {address: 'name'} dict
+    """
+    return autodetect_and_load(f).to_symbol_dict()
 
 
 def add_map_output_arguments(parser: 'argparse.ArgumentParser', base_name, *args, **kwargs) -> None:
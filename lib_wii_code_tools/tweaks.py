@@ -1,6 +1,6 @@
 import dataclasses
 import re
-from typing import Dict, List, TextIO
+from typing import Dict, List, TextIO, Tuple
 
 
 class SymbolsTweaker:
@@ -51,6 +51,59 @@ class SymbolsTweaker:
         self.deletions = []
         self.renames = []
 
+    # The dict forms of the lists above are built on first use and then
+    # cached, since they're needed every time symbols are remapped
+    # through this version. So don't modify the lists after that point.
+
+    _additions_dict = None
+    @property
+    def additions_dict(self) -> Dict[int, str]:
+        """
+        {address: name, ...}
+        """
+        if self._additions_dict is None:
+            self._additions_dict = {a.address: a.name for a in self.additions}
+        return self._additions_dict
+
+    _deletions_dict = None
+    @property
+    def deletions_dict(self) -> Dict[int, str]:
+        """
+        {address: name, ...}
+        """
+        if self._deletions_dict is None:
+            self._deletions_dict = {d.address: d.name for d in self.deletions}
+        return self._deletions_dict
+
+    _renames_dict = None
+    _renames_dict_reversed = None
+    def _build_renames_dicts(self) -> None:
+        # Both directions are built together, in one pass over the list
+        self._renames_dict = {}
+        self._renames_dict_reversed = {}
+        for r in self.renames:
+            self._renames_dict[r.address_from] = (r.address_to, r.name_from, r.name_to)
+            self._renames_dict_reversed[r.address_to] = (r.address_from, r.name_to, r.name_from)
+
+    @property
+    def renames_dict(self) -> Dict[int, Tuple[int, str, str]]:
+        """
+        {address_from: (address_to, name_from, name_to), ...}
+        """
+        if self._renames_dict is None:
+            self._build_renames_dicts()
+        return self._renames_dict
+
+    @property
+    def renames_dict_reversed(self) -> Dict[int, Tuple[int, str, str]]:
+        """
+        Same as renames_dict, but with the "from" and "to" fields swapped:
+        {address_to: (address_from, name_to, name_from), ...}
+        """
+        if self._renames_dict_reversed is None:
+            self._build_renames_dicts()
+        return self._renames_dict_reversed
+
 
 # Type alias
 SymbolsTweakMap = Dict[str, SymbolsTweaker]
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 from pathlib import Path
 from typing import List, Optional
 
@@ -47,6 +48,8 @@ def main(args: Optional[List[str]] = None) -> None:
         f' (default: "{DEFAULT_OUTPUT_PATTERN}")')
     parser.add_argument('--single-version', metavar='VERSION',
         help='just export the result for a single version, not for all versions in the address map')
+    parser.add_argument('-q', '--quiet', action='store_true',
+        help="don't print progress messages while remapping")
 
     map_address.add_error_handler_args(parser)
 
@@ -65,8 +68,11 @@ def main(args: Optional[List[str]] = None) -> None:
     with parsed_args.address_map.open('r', encoding='utf-8') as f:
         mappers = lib_address_maps.load_address_map(f)
 
+    if parsed_args.single_version is not None and parsed_args.single_version not in mappers:
+        raise ValueError(f'--single-version: "{parsed_args.single_version}" is not in the address map')
+
     with parsed_args.symbol_map.open('r', encoding='utf-8') as f:
-        input_map = lib_symbol_map_formats.autodetect_and_load(f).to_symbol_dict()
+        input_map = lib_symbol_map_formats.autodetect_and_load_as_dict(f)
 
     if parsed_args.tweaks is None:
         tweaks = {'default': lib_tweaks.SymbolsTweaker()}
@@ -84,26 +90,28 @@ def main(args: Optional[List[str]] = None) -> None:
         mappers,
         tweaks,
         error_handling=error_handling,
-        verbose=True)
+        verbose=not parsed_args.quiet,
+        only_target=parsed_args.single_version)
 
     parsed_args.output_folder.mkdir(parents=True, exist_ok=True)
 
-    for name, remapped_syms in all_remapped_syms.items():
-        if name == 'default':
-            continue
-
-        # This is kind of inefficient, but a lot simpler and more
-        # maintainable than having a completely different code path for
-        # mapping the symbols as directly as possible to a single target
-        # version
-        if parsed_args.single_version is not None and name != parsed_args.single_version:
-            continue
-
-        lib_nsmbw.save_nsmbw_symbol_map(
-            remapped_syms,
-            name,
-            parsed_args.output_format,
-            parsed_args.output_folder / parsed_args.output_pattern.replace('$VER$', name))
+    # Save the output files in parallel, since they're independent
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = []
+        for name, remapped_syms in all_remapped_syms.items():
+            if name == 'default':
+                continue
+
+            futures.append(executor.submit(
+                lib_nsmbw.save_nsmbw_symbol_map,
+                remapped_syms,
+                name,
+                parsed_args.output_format,
+                parsed_args.output_folder / parsed_args.output_pattern.replace('$VER$', name)))
+
+        # (Re-raise any exceptions)
+        for future in futures:
+            future.result()
 
 
 if __name__ == '__main__':
@@ -1,22 +1,187 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
+import itertools
+import mmap
 from pathlib import Path
 import struct
-from typing import BinaryIO, List, Optional, Tuple
+import sys
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 
 from lib_wii_code_tools import code_files
 from lib_wii_code_tools.code_files import all as code_files_all
 from lib_wii_code_tools.code_files import rel as code_files_rel
 from lib_wii_code_tools import nsmbw_constants as lib_nsmbw_constants
 
-# TODO: get rid of this dependency probably
-import elftools.elf.enums as elf_enums  # pip install pyelftools
+
+RELRT = code_files_rel.RELRelocationType
+
+# Meta relocation types, as plain ints. All of these are higher than
+# any of the real (R_PPC_*) relocation types.
+R_DOLPHIN_NOP = RELRT.R_DOLPHIN_NOP.value
+R_DOLPHIN_SECTION = RELRT.R_DOLPHIN_SECTION.value
+R_DOLPHIN_END = RELRT.R_DOLPHIN_END.value
+R_DOLPHIN_MRKREF = RELRT.R_DOLPHIN_MRKREF.value
 
 
 # Base address of mem1.raw memdump files
 MEMDUMP_BASE = 0x80000000
 
+# Precompiled structs for reading and writing relocation targets
+STRUCT_U16 = struct.Struct('>H')
+STRUCT_U32 = struct.Struct('>I')
+STRUCTS_BY_WRITE_SIZE = {2: STRUCT_U16, 4: STRUCT_U32}
+
+# Raw relocation table entry (for --debug-dump-relocs)
+STRUCT_RELOC = struct.Struct('>HBBI')
+
+# ELF program and section headers
+STRUCT_ELF_PHDR = struct.Struct('>8I')
+STRUCT_ELF_SHDR = struct.Struct('>10I')
+
+# ELF constants (values from the ELF spec)
+ELFCLASS32 = 1
+ELFDATA2MSB = 2
+EV_CURRENT = 1
+ELFOSABI_SYSV = 0  # aka ELFOSABI_NONE
+ET_NONE = 0
+EM_PPC = 20
+PT_LOAD = 1
+PF_X = 1
+PF_W = 2
+PF_R = 4
+SHT_PROGBITS = 1
+SHT_STRTAB = 3
+SHT_NOBITS = 8
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_STRINGS = 0x20
+
+
+def verify_fits(addr_to_write: int, size: int, cleared_bottom_bits: int = 0, *, signed: bool = False) -> bool:
+    """
+    Verify that addr_to_write will fit into a field of size size
+    which also requires that the bottom cleared_bottom_bits bits be
+    cleared
+    """
+    if addr_to_write & ((1 << cleared_bottom_bits) - 1) != 0:
+        return False
+    addr_to_write >>= cleared_bottom_bits
+
+    if signed:
+        return -(1 << (size - 1)) <= addr_to_write < (1 << (size - 1))
+    else:
+        return 0 <= addr_to_write < (1 << size)
+
+
+def prepare_signed(value: int, size: int) -> int:
+    """
+    Convert a signed int to an unsigned int (two's complement) of
+    arbitrary size
+    """
+    return value & ((1 << size) - 1)
+
+
+# Per-relocation-type functions for calculate_relocation_write_value().
+# Each one takes (write_addr, addr_to_write, initial_value_32) and
+# returns (should_write, write_value, write_size).
+
+NO_WRITE = (False, None, None)
+
+
+def _reloc_none(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # No write.
+    return NO_WRITE
+
+
+def _reloc_addr32(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 32-bit write.
+    return True, addr_to_write, 4
+
+
+def _reloc_addr24(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 24-bit write, preserving the bottom 2 and top 6 bits of the initial u32.
+    # Address must fit in that window or it's skipped
+    if not verify_fits(addr_to_write, 24, 2):
+        return NO_WRITE
+    return True, (initial_value_32 & 0xfc000003) | (addr_to_write & 0x03fffffc), 4
+
+
+def _reloc_addr16(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 16-bit write.
+    # Address must fit in 16 bits or it's skipped
+    if not verify_fits(addr_to_write, 16):
+        return NO_WRITE
+    return True, addr_to_write, 2
+
+
+def _reloc_addr16_lo(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 16-bit write.
+    # Take the bottom half of the address
+    return True, addr_to_write & 0xffff, 2
+
+
+def _reloc_addr16_hi(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 16-bit write.
+    # Take the top half of the address
+    return True, addr_to_write >> 16, 2
+
+
+def _reloc_addr16_ha(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 16-bit write.
+    # Uses the "high adjusted" value of the address:
+    # https://www.nxp.com/docs/en/reference-manual/E500ABIUG.pdf, p83
+    # (That is, the top half, plus 1 if bit 0x8000 is set. Adding 0x8000
+    # before shifting does exactly that.)
+    return True, ((addr_to_write + 0x8000) >> 16) & 0xFFFF, 2
+
+
+def _reloc_addr14(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 14-bit write, preserving the bottom 2 and top 16 bits of the initial u32.
+    # Address must fit in that window or it's skipped
+    if not verify_fits(addr_to_write, 14, 2):
+        return NO_WRITE
+    return True, (initial_value_32 & 0xffff0003) | (addr_to_write & 0x0000fffc), 4
+
+
+def _reloc_rel24(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 24-bit write, preserving the bottom 2 and top 6 bits of the initial u32.
+    # Relative address is used instead of absolute.
+    # Relative address must fit in that window or it's skipped
+    rel_addr_to_write = addr_to_write - write_addr
+    if not verify_fits(rel_addr_to_write, 24, 2, signed=True):
+        return NO_WRITE
+    return True, (initial_value_32 & 0xfc000003) | (prepare_signed(rel_addr_to_write, 26) & 0x03fffffc), 4
+
+
+def _reloc_rel14(write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
+    # 14-bit write, preserving the bottom 2 and top 16 bits of the initial u32.
+    # Relative address is used instead of absolute.
+    # Relative address must fit in that window or it's skipped
+    rel_addr_to_write = addr_to_write - write_addr
+    if not verify_fits(rel_addr_to_write, 14, 2, signed=True):
+        return NO_WRITE
+    return True, (initial_value_32 & 0xffff0003) | (prepare_signed(rel_addr_to_write, 16) & 0x0000fffc), 4
+
+
+RELOCATION_WRITE_VALUE_FUNCS = {
+    RELRT.R_PPC_NONE: _reloc_none,
+    RELRT.R_PPC_ADDR32: _reloc_addr32,
+    RELRT.R_PPC_ADDR24: _reloc_addr24,
+    RELRT.R_PPC_ADDR16: _reloc_addr16,
+    RELRT.R_PPC_ADDR16_LO: _reloc_addr16_lo,
+    RELRT.R_PPC_ADDR16_HI: _reloc_addr16_hi,
+    RELRT.R_PPC_ADDR16_HA: _reloc_addr16_ha,
+    RELRT.R_PPC_ADDR14: _reloc_addr14,
+    RELRT.R_PPC_ADDR14_BRTAKEN: _reloc_addr14,
+    RELRT.R_PPC_ADDR14_BRNTAKEN: _reloc_addr14,
+    RELRT.R_PPC_REL24: _reloc_rel24,
+    RELRT.R_PPC_REL14: _reloc_rel14,
+    RELRT.R_PPC_REL14_BRTAKEN: _reloc_rel14,
+    RELRT.R_PPC_REL14_BRNTAKEN: _reloc_rel14,
+}
 
 def calculate_relocation_write_value(reloc: code_files_rel.RELRelocation, write_addr: int, addr_to_write: int, initial_value_32: int) -> Tuple[bool, int, int]:
     """
@@ -26,180 +191,142 @@ def calculate_relocation_write_value(reloc: code_files_rel.RELRelocation, write_
 
     Returns (should_write: bool, write_value: int, write_size: int).
     """
-    RELRT = code_files_rel.RELRelocationType
-    NO_WRITE = (False, None, None)
+    func = RELOCATION_WRITE_VALUE_FUNCS.get(reloc.type)
+    if func is None:
+        raise ValueError(f'Unknown relocation type: {reloc.type}')
 
-    rel_addr_to_write = addr_to_write - write_addr
+    return func(write_addr, addr_to_write, initial_value_32)
 
-    write_size = 4
 
-    def verify_fits(addr_to_write: int, size: int, cleared_bottom_bits: int = 0, *, signed: bool = False) -> bool:
-        """
-        Verify that addr_to_write will fit into a field of size size
-        which also requires that the bottom cleared_bottom_bits bits be
-        cleared
-        """
-        if addr_to_write & ((1 << cleared_bottom_bits) - 1) != 0:
-            return False
-        addr_to_write >>= cleared_bottom_bits
+def iter_relocation_targets(
+        imp: code_files_rel.RELImport, *, warn: Callable[[str], None] = print,
+        ) -> Iterator[Tuple[int, int, code_files_rel.RELRelocation]]:
+    """
+    Walk through an import's relocations, handling the meta relocation
+    types along the way, and yield
+    (section_id: int, write_pos: int, reloc: RELRelocation)
+    for each relocation that actually needs to be applied.
+    Warnings are passed to warn().
+    """
+    section_id = 0
+    write_pos = 0
 
-        if signed:
-            return -(1 << (size - 1)) <= addr_to_write < (1 << (size - 1))
-        else:
-            return 0 <= addr_to_write < (1 << size)
+    for reloc in imp.relocations:
+        write_pos += reloc.offset
 
-    def prepare_signed(value: int, size: int) -> int:
-        """
-        Convert a signed int to an unsigned int (two's complement) of
-        arbitrary size
-        """
-        return value & ((1 << size) - 1)
+        # (Compared against plain ints, rather than looking up the enum
+        # members on the enum class every time)
+        type = reloc.type
 
-    if reloc.type == RELRT.R_PPC_NONE:
-        # No write.
-        return NO_WRITE
+        # Most relocations aren't meta types, so check for that first
+        if type < R_DOLPHIN_NOP:
+            yield section_id, write_pos, reloc
 
-    elif reloc.type == RELRT.R_PPC_ADDR32:
-        # 32-bit write.
-        new_value = addr_to_write
-
-    elif reloc.type == RELRT.R_PPC_ADDR24:
-        # 24-bit write, preserving the bottom 2 and top 6 bits of the initial u32.
-        # Address must fit in that window or it's skipped
-        if not verify_fits(addr_to_write, 24, 2):
-            return NO_WRITE
-        new_value = (initial_value_32 & 0xfc000003) | (addr_to_write & 0x03fffffc)
-
-    elif reloc.type == RELRT.R_PPC_ADDR16:
-        # 16-bit write.
-        # Address must fit in 16 bits or it's skipped
-        if not verify_fits(addr_to_write, 16):
-            return NO_WRITE
-        new_value = addr_to_write
-        write_size = 2
-
-    elif reloc.type == RELRT.R_PPC_ADDR16_LO:
-        # 16-bit write.
-        # Take the bottom half of the address
-        new_value = addr_to_write & 0xffff
-        write_size = 2
-
-    elif reloc.type == RELRT.R_PPC_ADDR16_HI:
-        # 16-bit write.
-        # Take the top half of the address
-        new_value = addr_to_write >> 16
-        write_size = 2
-
-    elif reloc.type == RELRT.R_PPC_ADDR16_HA:
-        # 16-bit write.
-        # Uses the "high adjusted" value of the address:
-        # https://www.nxp.com/docs/en/reference-manual/E500ABIUG.pdf, p83
-        new_value = ((addr_to_write >> 16) + (1 if (addr_to_write & 0x8000) else 0)) & 0xFFFF
-        write_size = 2
-
-    elif reloc.type in [RELRT.R_PPC_ADDR14, RELRT.R_PPC_ADDR14_BRTAKEN, RELRT.R_PPC_ADDR14_BRNTAKEN]:
-        # 14-bit write, preserving the bottom 2 and top 16 bits of the initial u32.
-        # Address must fit in that window or it's skipped
-        if not verify_fits(addr_to_write, 14, 2):
-            return NO_WRITE
-        new_value = (initial_value_32 & 0xffff0003) | (addr_to_write & 0x0000fffc)
-
-    elif reloc.type == RELRT.R_PPC_REL24:
-        # 24-bit write, preserving the bottom 2 and top 6 bits of the initial u32.
-        # Relative address is used instead of absolute.
-        # Relative address must fit in that window or it's skipped
-        if not verify_fits(rel_addr_to_write, 24, 2, signed=True):
-            return NO_WRITE
-        new_value = (initial_value_32 & 0xfc000003) | (prepare_signed(rel_addr_to_write, 26) & 0x03fffffc)
-
-    elif reloc.type in [RELRT.R_PPC_REL14, RELRT.R_PPC_REL14_BRTAKEN, RELRT.R_PPC_REL14_BRNTAKEN]:
-        # 14-bit write, preserving the bottom 2 and top 16 bits of the initial u32.
-        # Relative address is used instead of absolute.
-        # Relative address must fit in that window or it's skipped
-        if not verify_fits(rel_addr_to_write, 14, 2, signed=True):
-            return NO_WRITE
-        new_value = (initial_value_32 & 0xffff0003) | (prepare_signed(rel_addr_to_write, 16) & 0x0000fffc)
+        # Handle meta relocation types
+        elif type == R_DOLPHIN_NOP:
+            continue
+        elif type == R_DOLPHIN_SECTION:
+            section_id = reloc.section
+            write_pos = 0
+            continue
+        elif type == R_DOLPHIN_END:
+            break
+        elif type == R_DOLPHIN_MRKREF:
+            warn('WARNING: skipping R_DOLPHIN_MRKREF')
+            continue
 
-    else:
-        raise ValueError(f'Unknown relocation type: {reloc.type}')
 
-    return True, new_value, write_size
+def verify_against_memdump(memdump: bytes, addr: int, value: int, write_size: int) -> None:
+    """
+    Verify that the value given, of specified size, appears in the
+    memdump at the specified address.
+    Raises an exception if it doesn't match.
+    """
+    offset = addr - MEMDUMP_BASE
+    real_value = int.from_bytes(memdump[offset : offset + write_size], 'big')
+    if value != real_value:
+        raise ValueError(f'Verification via memdump: {addr:08X}: expected {value:08X} but correct value is actually {real_value:08X}')
 
 
-def apply_all_relocations(
-        dol: code_files.CodeFile, rels: List[code_files_rel.REL],
-        *, memdump_file_for_verification: BinaryIO = None, dump_relocs: bool = False) -> None:
+def apply_rel_relocations(
+        rel: code_files_rel.REL, module_section_addresses: Dict[int, List[int]],
+        *, memdump: bytes = None, dump_relocs: bool = False) -> None:
     """
-    Apply all REL relocations, in-place
+    Apply the relocations for a single REL, in-place.
+    module_section_addresses should map each module ID to a list of the
+    addresses of that module's sections.
     """
+    # Bind these to locals, since they're used for every relocation
+    unpack_u32 = STRUCT_U32.unpack_from
+    calculate_write_value = calculate_relocation_write_value
+    structs_by_write_size = STRUCTS_BY_WRITE_SIZE
 
-    def verify(addr: int, value: int, write_size: int) -> None:
-        """
-        Verify that the value given, of specified size, appears in the
-        memdump file at the specified address.
-        Raises an exception if it doesn't match.
-        """
-        nonlocal memdump_file_for_verification
-        if memdump_file_for_verification is None:
-            return
-
-        memdump_file_for_verification.seek(addr - MEMDUMP_BASE)
-        real_value = int.from_bytes(memdump_file_for_verification.read(write_size), 'big')
-        if value != real_value:
-            raise ValueError(f'Verification via memdump: {addr:08X}: expected {value:08X} but correct value is actually {real_value:08X}')
+    # Apply all imports
+    for imp in rel.imports:
+        # Relocations against the DOL use absolute addresses, so only
+        # REL section addresses need to be added
+        if imp.module_num > 0:
+            importing_from_addresses = module_section_addresses[imp.module_num]
+        else:
+            importing_from_addresses = None
 
-    # Make an id -> module map
-    modules = {0: dol}
-    for rel in rels:
-        if rel.id in modules:
-            raise ValueError(f'Duplicate REL ID: {rel.id}')
-        modules[rel.id] = rel
+        # (The target section only changes at R_DOLPHIN_SECTION, so
+        # only look it up again when that happens)
+        target_section_id = None
 
-    # Switch everything to bytearrays
-    for module in modules.values():
-        for section in module.sections:
-            if section.data:
-                section.data = bytearray(section.data)
+        # Fast path for when there's no verifying or dumping to do. This
+        # is the same as the loop below, minus those parts.
+        if memdump is None and not dump_relocs:
+            for section_id, write_pos, reloc in iter_relocation_targets(imp):
+                if section_id != target_section_id:
+                    target_section_id = section_id
+                    target_address = rel.sections[section_id].address
+                    target_bytearray = rel.sections[section_id].data
 
-    # Apply all imports
-    for rel in rels:
-        for imp in rel.imports:
-            importing_from_module = modules[imp.module_num]
+                addr_to_write = reloc.addend
+                if importing_from_addresses is not None:
+                    addr_to_write += importing_from_addresses[reloc.section]
 
-            section_id = 0
-            write_pos = 0
+                initial_value_32, = unpack_u32(target_bytearray, write_pos)
+                should_write, write_value, write_size = \
+                    calculate_write_value(reloc, target_address + write_pos, addr_to_write, initial_value_32)
+
+                if should_write:
+                    structs_by_write_size[write_size].pack_into(target_bytearray, write_pos, write_value)
+
+            continue
+
+        # Dump output is collected and printed all at once for each
+        # import, rather than one line at a time
+        dump_lines = []
+        dump_lines_append = dump_lines.append
+
+        try:
+            # (Warnings go into the dump too, so they stay in order with
+            # the lines around them)
+            for section_id, write_pos, reloc in iter_relocation_targets(
+                    imp, warn=dump_lines_append if dump_relocs else print):
+                if section_id != target_section_id:
+                    target_section_id = section_id
+                    target_address = rel.sections[section_id].address
+                    target_bytearray = rel.sections[section_id].data
 
-            for reloc in imp.relocations:
-                write_pos += reloc.offset
-
-                # Handle meta relocation types first
-                if reloc.type == code_files_rel.RELRelocationType.R_DOLPHIN_NOP:
-                    continue
-                elif reloc.type == code_files_rel.RELRelocationType.R_DOLPHIN_SECTION:
-                    section_id = reloc.section
-                    write_pos = 0
-                    continue
-                elif reloc.type == code_files_rel.RELRelocationType.R_DOLPHIN_END:
-                    break
-                elif reloc.type == code_files_rel.RELRelocationType.R_DOLPHIN_MRKREF:
-                    print('WARNING: skipping R_DOLPHIN_MRKREF')
-                    continue
-
-                write_addr = rel.sections[section_id].address + write_pos
-                target_bytearray = rel.sections[section_id].data
+                write_addr = target_address + write_pos
 
                 addr_to_write = reloc.addend
-                if imp.module_num > 0:
-                    addr_to_write += importing_from_module.sections[reloc.section].address
+                if importing_from_addresses is not None:
+                    addr_to_write += importing_from_addresses[reloc.section]
 
-                initial_value_32, = struct.unpack_from('>I', target_bytearray, write_pos)
+                initial_value_32, = unpack_u32(target_bytearray, write_pos)
                 should_write, write_value, write_size = \
-                    calculate_relocation_write_value(reloc, write_addr, addr_to_write, initial_value_32)
+                    calculate_write_value(reloc, write_addr, addr_to_write, initial_value_32)
 
                 if dump_relocs:
-                    raw_reloc_table_data = struct.pack('>HBBI', reloc.offset, reloc.type.value, reloc.section, reloc.addend)
+                    raw_reloc_table_data = STRUCT_RELOC.pack(reloc.offset, reloc.type.value, reloc.section, reloc.addend)
 
-                    if write_size == 2:
+                    if not should_write:
+                        write_value_str = '----'
+                    elif write_size == 2:
                         write_value_str = f'    {write_value:02x}'
                     else:
                         write_value_str = f'{write_value:04x}'
@@ -210,26 +337,91 @@ def apply_all_relocations(
                     if not should_write:
                         msg.append(' (invalid; skipping)')
 
-                    print(''.join(msg))
+                    dump_lines_append(''.join(msg))
 
                 if should_write:
-                    if memdump_file_for_verification:
+                    if memdump is not None:
                         try:
-                            verify(write_addr, write_value, write_size)
+                            verify_against_memdump(memdump, write_addr, write_value, write_size)
                         except ValueError:
                             raise ValueError(
                                 f'Memdump verification failed for reloc {reloc.type}'
                                 f' (trying to write address {addr_to_write:08X} into field'
                                 f' with initial value {initial_value_32:08X})')
 
-                    struct_string = {2: '>H', 4: '>I'}[write_size]
-                    struct.pack_into(struct_string, target_bytearray, write_pos, write_value)
+                    structs_by_write_size[write_size].pack_into(target_bytearray, write_pos, write_value)
+
+        finally:
+            if dump_lines:
+                sys.stdout.write('\n'.join(dump_lines) + '\n')
+
+
+def _apply_rel_relocations_in_subprocess(
+        rel: code_files_rel.REL, module_section_addresses: Dict[int, List[int]]) -> List[Optional[bytearray]]:
+    """
+    Worker function for apply_all_relocations(). Applies a REL's
+    relocations and returns the resulting data for each section.
+    """
+    apply_rel_relocations(rel, module_section_addresses)
+    return [section.data for section in rel.sections]
+
+
+def apply_all_relocations(
+        dol: code_files.CodeFile, rels: List[code_files_rel.REL],
+        *, memdump_file_for_verification: BinaryIO = None, dump_relocs: bool = False,
+        workers: int = 1) -> None:
+    """
+    Apply all REL relocations, in-place.
+    If workers is more than 1, RELs are processed in parallel across
+    that many processes, except when verifying or dumping relocations.
+    """
+    # Make an id -> module map
+    modules = {0: dol}
+    for rel in rels:
+        if rel.id in modules:
+            raise ValueError(f'Duplicate REL ID: {rel.id}')
+        modules[rel.id] = rel
 
-    # Switch everything back to bytes
-    for module in modules.values():
-        for section in module.sections:
-            if section.data:
-                section.data = bytes(section.data)
+    # Relocations are only ever written into REL sections, which are
+    # loaded as bytearrays already. Just in case any were created some
+    # other way, though, make sure they're all mutable.
+    for rel in rels:
+        for section in rel.sections:
+            if section.data and not isinstance(section.data, bytearray):
+                section.data = bytearray(section.data)
+
+    # Each REL's relocations only write to its own sections, and only
+    # need the *addresses* of other modules' sections
+    module_section_addresses = {id: [s.address for s in module.sections] for id, module in modules.items()}
+
+    # Verification and dumping happen as relocations are applied, and
+    # should stay in order, so those are always done in this process
+    if workers <= 1 or len(rels) <= 1 or memdump_file_for_verification is not None or dump_relocs:
+        # Map (or failing that, read) the whole memdump up front, rather
+        # than seeking and reading from the file for every relocation
+        memdump = None
+        if memdump_file_for_verification is not None:
+            try:
+                memdump = mmap.mmap(memdump_file_for_verification.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                memdump_file_for_verification.seek(0)
+                memdump = memdump_file_for_verification.read()
+
+        try:
+            for rel in rels:
+                apply_rel_relocations(rel, module_section_addresses, memdump=memdump, dump_relocs=dump_relocs)
+        finally:
+            if isinstance(memdump, mmap.mmap):
+                memdump.close()
+        return
+
+    # Applying relocations is pure Python, so use processes rather than
+    # threads to get around the GIL
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(rels))) as executor:
+        results = executor.map(_apply_rel_relocations_in_subprocess, rels, itertools.repeat(module_section_addresses))
+        for rel, sections_data in zip(rels, results):
+            for section, data in zip(rel.sections, sections_data):
+                section.data = data
 
 
 def create_elf_from_sections(sections: List[code_files.CodeFileSection], section_names: List[str], section_perms: List[lib_nsmbw_constants.Permissions], *, entry_point:int=0) -> bytes:
@@ -258,16 +450,13 @@ def create_elf_from_sections(sections: List[code_files.CodeFileSection], section
     # Let's start by building .shrtrtab
     section_names.append('.shrtrtab')
 
-    shrtrtab_data = bytearray()
-
-    shrtrtab_offsets = []
-    for name in section_names:
-        shrtrtab_offsets.append(len(shrtrtab_data))
-        shrtrtab_data += name.encode('ascii') + b'\0'
+    encoded_names = [name.encode('ascii') + b'\0' for name in section_names]
+    shrtrtab_data = b''.join(encoded_names)
+    shrtrtab_offsets = list(itertools.accumulate((len(name) for name in encoded_names[:-1]), initial=0))
 
     shrtrtab = code_files.CodeFileSection()
     shrtrtab.address = 0
-    shrtrtab.data = bytes(shrtrtab_data)
+    shrtrtab.data = shrtrtab_data
     shrtrtab.size = len(shrtrtab_data)
     shrtrtab.is_executable = False
 
@@ -275,39 +464,37 @@ def create_elf_from_sections(sections: List[code_files.CodeFileSection], section
     sections.append(shrtrtab)
     section_perms.append(lib_nsmbw_constants.Permissions.none())
 
-    # Start the elf data
-    elf = bytearray()
-
-    def align_elf(alignment):
-        nonlocal elf
-        if len(elf) % alignment:
-            elf += b'\0' * (alignment - (len(elf) % alignment))
-        assert len(elf) % alignment == 0
-
-    # Skip the header for now, we'll come back to it when we have
-    # offsets and stuff
-    elf += b'\0' * 0x40
-
-    # Skip the program headers, too
-    e_phoff = len(elf)
+    # Lay out the whole file first, so that it can be allocated all at
+    # once:
+    # - ELF header (we'll come back to it when we have offsets and stuff)
+    # - Program headers
+    # - Section data (each aligned to 0x10)
+    # - Section headers
+    e_phoff = 0x40
     e_phentsize = 0x20
 
-    elf += b'\0' * (e_phentsize * len(sections))
+    end_of_data = e_phoff + e_phentsize * len(sections)
 
-    # Add section data
     section_offsets = []
     for section in sections:
         if section.is_bss():
             section_offsets.append(0)
         else:
-            section_offsets.append(len(elf))
-            elf += section.data
-            align_elf(0x10)
+            section_offsets.append(end_of_data)
+            end_of_data += len(section.data)
+            end_of_data += -end_of_data % 0x10
+
+    e_shoff = end_of_data
+    e_shentsize = 0x28
+
+    elf = bytearray(e_shoff + e_shentsize * len(sections))
+
+    # Add section data
+    for offset, section in zip(section_offsets, sections):
+        if not section.is_bss():
+            elf[offset : offset + len(section.data)] = section.data
 
     # Fill in the program headers
-    PF_X = 1
-    PF_W = 2
-    PF_R = 4
     for i, (offset, section, perms) in enumerate(zip(section_offsets, sections, section_perms)):
         if section is shrtrtab:
             # Don't want .shrtrtab to be loaded at all
@@ -321,9 +508,9 @@ def create_elf_from_sections(sections: List[code_files.CodeFileSection], section
         if perms & lib_nsmbw_constants.Permissions.X:
             p_flags |= PF_X
 
-        struct.pack_into('>8I', elf, e_phoff + e_phentsize * i,
+        STRUCT_ELF_PHDR.pack_into(elf, e_phoff + e_phentsize * i,
             # ==== 0x00 ====
-            elf_enums.ENUM_P_TYPE_BASE['PT_LOAD'],
+            PT_LOAD,
             offset,
             section.address,
             0,
@@ -335,20 +522,14 @@ def create_elf_from_sections(sections: List[code_files.CodeFileSection], section
         )
 
     # Add the section headers
-    SHF_WRITE = 0x1
-    SHF_ALLOC = 0x2
-    SHF_EXECINSTR = 0x4
-    SHF_STRINGS = 0x20
-    e_shoff = len(elf)
-    e_shentsize = 0x28
-    for offset, sh_name, section, perms in zip(section_offsets, shrtrtab_offsets, sections, section_perms):
+    for i, (offset, sh_name, section, perms) in enumerate(zip(section_offsets, shrtrtab_offsets, sections, section_perms)):
 
         if section is shrtrtab:
-            sh_type = elf_enums.ENUM_SH_TYPE_BASE['SHT_STRTAB']
+            sh_type = SHT_STRTAB
         elif section.is_bss():
-            sh_type = elf_enums.ENUM_SH_TYPE_BASE['SHT_NOBITS']
+            sh_type = SHT_NOBITS
         else:
-            sh_type = elf_enums.ENUM_SH_TYPE_BASE['SHT_PROGBITS']
+            sh_type = SHT_PROGBITS
 
         sh_flags = 0
         if perms & lib_nsmbw_constants.Permissions.R:
@@ -360,7 +541,7 @@ def create_elf_from_sections(sections: List[code_files.CodeFileSection], section
         if section is shrtrtab:
             sh_flags |= SHF_STRINGS
 
-        elf += struct.pack('>10I',
+        STRUCT_ELF_SHDR.pack_into(elf, e_shoff + e_shentsize * i,
             # ==== 0x00 ====
             sh_name,
             sh_type,
@@ -382,15 +563,15 @@ def create_elf_from_sections(sections: List[code_files.CodeFileSection], section
     struct.pack_into('>' '4s 5B 7x' '2H 3I' '2I 4H' '2H 12x', elf, 0,
         # ==== 0x00 ====
         b'\x7fELF',
-        elf_enums.ENUM_EI_CLASS['ELFCLASS32'],
-        elf_enums.ENUM_EI_DATA['ELFDATA2MSB'],
-        elf_enums.ENUM_E_VERSION['EV_CURRENT'],
-        elf_enums.ENUM_EI_OSABI['ELFOSABI_SYSV'],  # aka ELFOSABI_NONE
+        ELFCLASS32,
+        ELFDATA2MSB,
+        EV_CURRENT,
+        ELFOSABI_SYSV,
         0,  # EI_ABIVERSION
         # ==== 0x10 ====
-        elf_enums.ENUM_E_TYPE['ET_NONE'],
-        elf_enums.ENUM_E_MACHINE['EM_PPC'],
-        elf_enums.ENUM_E_VERSION['EV_CURRENT'],
+        ET_NONE,
+        EM_PPC,
+        EV_CURRENT,
         entry_point,
         e_phoff,
         # ==== 0x20 ====
@@ -434,6 +615,8 @@ def main(args: Optional[List[str]] = None) -> None:
         ' Example: "807685a0,8076a558,8076a560,8076a570,8076a748,8076d460"')
     parser.add_argument('--debug-dump-relocs', action='store_true',
         help='for debugging: print info about the relocations table')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+        help='apply relocations for up to N RELs at once, in separate processes (default: 1)')
 
     parsed_args = parser.parse_args(args)
 
@@ -446,7 +629,21 @@ def main(args: Optional[List[str]] = None) -> None:
         out_fp = parsed_args.output
 
     # Load dol
-    dol = code_files_all.load_by_extension(parsed_args.main_code_file.read_bytes(), parsed_args.main_code_file.suffix)
+    # (Memory-mapped rather than read, since only the sections are
+    # needed, and those get copied out of it anyway)
+    with parsed_args.main_code_file.open('rb') as f:
+        try:
+            main_code_file_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file, or not something that can be mapped (e.g. a
+            # pipe)
+            main_code_file_data = f.read()
+    dol = code_files_all.load_by_extension(main_code_file_data, parsed_args.main_code_file.suffix)
+    if isinstance(main_code_file_data, mmap.mmap):
+        # The loaders copy each section's data out of it (slicing an
+        # mmap makes a bytes copy), and nothing reads dol.data after
+        # loading, so it can be closed now
+        main_code_file_data.close()
 
     # Load rels and parse and assign addresses for their sections
     if parsed_args.rel is not None:
@@ -475,7 +672,7 @@ def main(args: Optional[List[str]] = None) -> None:
 
     # Apply relocations, optionally verifying with a memdump
     aar_args = [dol, [rel for name, rel in rels]]
-    aar_kwargs = {}
+    aar_kwargs = {'workers': parsed_args.jobs}
     if parsed_args.debug_dump_relocs:
         aar_kwargs['dump_relocs'] = True
 
@@ -517,13 +714,25 @@ def main(args: Optional[List[str]] = None) -> None:
     else:
         out_fp.mkdir(parents=True, exist_ok=True)
 
-        for i, (section, name) in enumerate(zip(sections, section_names)):
+        def write_section_file(path: Path, section: code_files.CodeFileSection) -> None:
             if section.is_bss():
-                section_data = b'\0' * section.size
+                # Extending an empty file fills it with zeros, without
+                # having to allocate them (and the file may even end up
+                # sparse, depending on the filesystem)
+                with path.open('wb') as f:
+                    f.truncate(section.size)
             else:
-                section_data = section.data
+                path.write_bytes(section.data)
+
+        # Save the files in parallel, since they're independent
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = []
+            for i, (section, name) in enumerate(zip(sections, section_names)):
+                futures.append(executor.submit(write_section_file, out_fp / f'{i:02d}_{name}.bin', section))
 
-            (out_fp / f'{i:02d}_{name}.bin').write_bytes(section_data)
+            # (Re-raise any exceptions)
+            for future in futures:
+                future.result()
 
 
 if __name__ == '__main__':
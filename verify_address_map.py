@@ -1,9 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
+import bisect
+import concurrent.futures
 import functools
+import itertools
+import json
+import mmap
+import re
 from pathlib import Path
-from typing import Callable, Iterator, List, Optional, Tuple
+import struct
+import sys
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
 
 from lib_wii_code_tools import code_files
 from lib_wii_code_tools.code_files import all as code_files_all
@@ -12,6 +20,9 @@ from lib_wii_code_tools import common
 from lib_wii_code_tools import address_maps as lib_address_maps
 from lib_wii_code_tools import nsmbw as lib_nsmbw
 
+STRUCT_U32 = struct.Struct('>I')
+
+
 # Zero fields and reserved fields should both be included in the masks:
 # "If a reserved field does not have all bits cleared, or if a field
 # that must contain a particular value does not contain that value, the
@@ -312,6 +323,17 @@ PPC_OPCODES = [
 ]
 
 
+def read_u32(data: bytes, offset: int) -> int:
+    """
+    Read a big-endian u32 from some data (or as much of one as there is,
+    if it runs off the end)
+    """
+    if offset + 4 <= len(data):
+        return STRUCT_U32.unpack_from(data, offset)[0]
+    else:
+        return int.from_bytes(data[offset : offset+4], 'big')
+
+
 def create_instruction_name_lookup_func() -> Callable[[int], str]:
     """
     Return a function that lets you look up instruction names.
@@ -323,60 +345,171 @@ def create_instruction_name_lookup_func() -> Callable[[int], str]:
     # Using this rather than looping over PPC_OPCODES makes this program
     # about 2x as fast.
     # mask_to_values structure: {mask: {value: name, ...}, ...}
+    # (Names are interned, so that comparing two equal ones is just an
+    # identity check)
     mask_to_values = {}
     for mask, masked_val, name in PPC_OPCODES:
         if mask not in mask_to_values:
             mask_to_values[mask] = {}
-        mask_to_values[mask][masked_val] = name
+        mask_to_values[mask][masked_val] = sys.intern(name)
 
     # Now sort that by dict size, so the dicts are checked roughly in
     # order of most- to least-likely to have a particular instruction.
     # This doesn't provide a measurable speedup, but seems like it *should* be more efficient, so...
-    mask_values_pairs = []
-    for mask, mask_dict in sorted(mask_to_values.items(), key=lambda elem: len(elem[1]), reverse=True):
-        mask_values_pairs.append((mask, mask_dict))
-
-    # Tried a bunch of cache sizes, 2048 seemed to work the best
-    @functools.lru_cache(maxsize=2048)
-    def get_inst_name(inst: int) -> str:
+    mask_values_pairs = sorted(mask_to_values.items(), key=lambda elem: len(elem[1]), reverse=True)
+
+    # Every mask includes the primary opcode (top 6 bits), so split the
+    # mask dicts up by primary opcode. That way, each lookup only has to
+    # probe the masks that could possibly match (at most 12, for
+    # primary opcode 31, which alone has over 150 entries).
+    # (Masks stay in the same order as above, so results don't change)
+    # by_primary structure: [[(mask, {value: name, ...}), ...], ...]
+    by_primary = [[] for _ in range(64)]
+    for mask, mask_dict in mask_values_pairs:
+        for opcode_primary in sorted({masked_val >> 26 for masked_val in mask_dict}):
+            by_primary[opcode_primary].append((mask, {
+                masked_val: name for masked_val, name in mask_dict.items()
+                if masked_val >> 26 == opcode_primary}))
+
+    def lookup_inst_name(inst: int) -> str:
         """
         Get the instruction name for a particular instruction
         """
-        nonlocal mask_values_pairs
-
         if inst == 0:
             return '(null)'
 
-        for mask, mask_dict in mask_values_pairs:
+        opcode_primary = inst >> 26
+
+        for mask, mask_dict in by_primary[opcode_primary]:
             name = mask_dict.get(inst & mask)
-            if name:
+            if name is not None:
                 return name
 
         # terminology here from 6xx_pem
         # also, this is necessarily an approximation
-        opcode_primary = inst >> 26
         if opcode_primary in {19, 31, 59, 63}:
             opcode_extended = inst & 0x7ff
-            return f'inst_{opcode_primary}_{opcode_extended}'
+            return sys.intern(f'inst_{opcode_primary}_{opcode_extended}')
         else:
-            return f'inst_{opcode_primary}'
+            return sys.intern(f'inst_{opcode_primary}')
+
+    # Cache the results in a dict with no size limit. Instructions that
+    # only differ by operands each need their own entry, so an
+    # lru_cache(maxsize=2048) was constantly evicting things, but a
+    # binary only has so many distinct instructions in total. Hits are
+    # faster this way, too, since __getitem__ doesn't call back into
+    # Python.
+    class InstNameCache(dict):
+        def __missing__(self, inst: int) -> str:
+            name = self[inst] = lookup_inst_name(inst)
+            return name
+
+    return InstNameCache().__getitem__
+
+
+def create_section_lookup_func(sections: List[code_files.CodeFileSection],
+        ) -> Callable[[int], Optional[code_files.CodeFileSection]]:
+    """
+    Return a function that finds the section containing a particular
+    address.
+    This involves keeping sorted, parallel lists of the sections and
+    their start and end addresses in a closure, so lookups can use a
+    binary search instead of a linear one, and don't need to touch any
+    section attributes.
+    """
+    sorted_sections = sorted(
+        (s for s in sections if s.address is not None and s.size),
+        key=lambda s: s.address)
+    starts = [s.address for s in sorted_sections]
+    ends = [s.address + s.size for s in sorted_sections]
+
+    def find_section_containing(address: int) -> Optional[code_files.CodeFileSection]:
+        """
+        Find the section containing a particular address
+        """
+        i = bisect.bisect_right(starts, address) - 1
+        if i >= 0 and address < ends[i]:
+            return sorted_sections[i]
+
+    return find_section_containing
+
+
+# Granularity of the page sets used by create_pointer_check_func()
+POINTER_CHECK_PAGE_SHIFT = 12
+
+
+def create_pointer_check_func(sections: List[code_files.CodeFileSection]) -> Callable[[int], bool]:
+    """
+    Return a function that checks if a value looks like a pointer (that
+    is, if it's an address in any of the sections).
+    Most values aren't pointers, so this first checks the value's
+    (4 KB) page against the set of pages the sections cover, which
+    rules almost all of those out without a full section lookup.
+    """
+    find_section_containing = create_section_lookup_func(sections)
+
+    pages = set()
+    for section in sections:
+        if section.address is None or not section.size: continue
+        pages.update(range(
+            section.address >> POINTER_CHECK_PAGE_SHIFT,
+            ((section.address + section.size - 1) >> POINTER_CHECK_PAGE_SHIFT) + 1))
+
+    def looks_like_pointer(value: int) -> bool:
+        """
+        Check if a value is an address in any of the sections
+        """
+        return (value >> POINTER_CHECK_PAGE_SHIFT in pages
+            and find_section_containing(value) is not None)
 
-    return get_inst_name
+    return looks_like_pointer
 
 
-def find_section_containing(address: int, sections: List[code_files.CodeFileSection], *,
-        executable: bool = None) -> code_files.CodeFileSection:
+def iter_address_ranges_from_sections(sections: List[code_files.CodeFileSection], *,
+        executable: bool = None, ignore_ranges: List[range] = (),
+        ) -> Iterator[Tuple[int, int, code_files.CodeFileSection]]:
     """
-    Find the section containing a particular address.
+    Iterate over (start, stop, section) ranges of addresses from a list
+    of code file sections, skipping any ignored addresses.
     If executable is True or False, only consider sections with
     matching executability.
     """
+    # Merge the ignored ranges into sorted, non-overlapping lists of
+    # starts and stops, so they can be binary-searched
+    ignore_starts = []
+    ignore_stops = []
+    for r in sorted((r for r in ignore_ranges if r), key=lambda r: r.start):
+        if ignore_stops and r.start <= ignore_stops[-1]:
+            ignore_stops[-1] = max(ignore_stops[-1], r.stop)
+        else:
+            ignore_starts.append(r.start)
+            ignore_stops.append(r.stop)
+
     for section in sections:
         if executable is not None:
             if section.is_executable != executable: continue
         if section.address is None: continue
-        if section.address <= address < section.address + section.size:
-            return section
+        if section.data is None: continue  # bss
+
+        # Split the section up into chunks that don't overlap any
+        # ignored ranges
+        address = section.address
+        end_address = section.address + section.size
+        while address < end_address:
+            i = bisect.bisect_right(ignore_starts, address) - 1
+            if i >= 0 and address < ignore_stops[i]:
+                # Skip to the end of this ignored range
+                address = ignore_stops[i]
+                continue
+
+            if i + 1 < len(ignore_starts):
+                chunk_end = min(end_address, ignore_starts[i + 1])
+            else:
+                chunk_end = end_address
+
+            yield address, chunk_end, section
+
+            address = chunk_end
 
 
 def iter_addresses_from_sections(sections: List[code_files.CodeFileSection], *,
@@ -389,110 +522,544 @@ def iter_addresses_from_sections(sections: List[code_files.CodeFileSection], *,
     matching executability.
     Only addresses aligned to align_to (a power of 2) will be yielded.
     """
-    prev_address = -1
+    return iter_addresses_from_ranges(iter_address_ranges_from_sections(
+        sections, executable=executable, ignore_ranges=ignore_ranges), align_to=align_to)
 
-    for section in sections:
-        if executable is not None:
-            if section.is_executable != executable: continue
-        if section.address is None: continue
-        if section.data is None: continue  # bss
 
-        for offset in range(section.size):
-            address = section.address + offset
+def iter_addresses_from_ranges(
+        address_ranges: Iterable[Tuple[int, int, code_files.CodeFileSection]], *, align_to: int = 1,
+        ) -> Iterator[Tuple[int, code_files.CodeFileSection]]:
+    """
+    Iterate over addresses (and their respective sections) from
+    (start, stop, section) ranges of addresses.
+    Only addresses aligned to align_to (a power of 2) will be yielded.
+    """
+    for start, stop, section in address_ranges:
+        # Round up to the alignment, and then step by it
+        first_address = (start + align_to - 1) & ~(align_to - 1)
+        for address in range(first_address, stop, align_to):
+            yield address, section
 
-            if align_to != 1:
-                address = address & ~(align_to - 1)
-                if address == prev_address:
-                    continue
 
-            if not any(address in r for r in ignore_ranges):
-                yield address, section
+# Matches runs of nonzero bytes
+NONZERO_BYTES_RE = re.compile(rb'[^\x00]+')
 
-            prev_address = address
 
+def iter_differing_runs(data_1: bytes, data_2: bytes, *, block_size: int = 0x8000) -> Iterator[Tuple[int, int]]:
+    """
+    Iterate over (start, stop) ranges of offsets at which two same-
+    length bytestrings differ. This is done without looping over the
+    bytes in Python: XORing the data (as big ints) leaves nonzero bytes
+    exactly where they differ, and a regex finds the runs of those.
+    The data is processed in blocks, so matching blocks can be skipped
+    with a plain comparison, and a few mismatches in a large section
+    don't require converting the whole thing to ints.
+    """
+    run_start = run_stop = None
 
-def compare_opcodes_across_versions(
-        code_file_1: code_files.CodeFile,
-        code_file_2: code_files.CodeFile,
-        rels_1: List[code_files_rel.REL],
-        rels_2: List[code_files_rel.REL],
+    for block_start in range(0, len(data_1), block_size):
+        block_1 = data_1[block_start : block_start + block_size]
+        block_2 = data_2[block_start : block_start + block_size]
+        if block_1 == block_2:
+            continue
+
+        diff = (int.from_bytes(block_1, 'big') ^ int.from_bytes(block_2, 'big')).to_bytes(len(block_1), 'big')
+        for match in NONZERO_BYTES_RE.finditer(diff):
+            start, stop = match.span()
+            start += block_start
+            stop += block_start
+
+            if start == run_stop:
+                # Continues a run from the end of the previous block
+                run_stop = stop
+            else:
+                if run_start is not None:
+                    yield run_start, run_stop
+                run_start, run_stop = start, stop
+
+    if run_start is not None:
+        yield run_start, run_stop
+
+
+def iter_differing_words(data_1: bytes, data_2: bytes) -> Iterator[int]:
+    """
+    Iterate over the offsets of the 4-byte words that differ between
+    two same-length bytestrings
+    """
+    next_offset = 0
+    for start, stop in iter_differing_runs(data_1, data_2):
+        for offset in range(max(start & ~3, next_offset), stop, 4):
+            yield offset
+        next_offset = (stop + 3) & ~3
+
+
+# (address_1, address_2, value_1, value_2), where the values are
+# instruction names (opcode comparison), bytestrings (data comparison),
+# or both None (the address maps outside of any section in code file 2)
+Mismatch = Tuple[int, int, Optional[Union[str, bytes]], Optional[Union[str, bytes]]]
+
+
+def format_mismatch(mismatch: Mismatch) -> str:
+    """
+    Format a mismatch as a human-readable warning message
+    """
+    address_1, address_2, value_1, value_2 = mismatch
+    if value_1 is None:
+        return f"{address_1:08x} -> {address_2:08x}: mapped address isn't in any section in code file 2"
+    else:
+        return f'{address_1:08x} -> {address_2:08x}: {value_1} -> {value_2}'
+
+
+def format_mismatch_json(mismatch: Mismatch) -> str:
+    """
+    Format a mismatch as a single-line JSON object
+    """
+    address_1, address_2, value_1, value_2 = mismatch
+    if value_1 is None:
+        obj = {'type': 'unmapped', 'address_1': f'{address_1:08x}', 'address_2': f'{address_2:08x}'}
+    elif isinstance(value_1, str):
+        obj = {'type': 'opcode', 'address_1': f'{address_1:08x}', 'address_2': f'{address_2:08x}',
+            'opcode_1': value_1, 'opcode_2': value_2}
+    else:
+        obj = {'type': 'data', 'address_1': f'{address_1:08x}', 'address_2': f'{address_2:08x}',
+            'bytes_1': value_1.hex(), 'bytes_2': value_2.hex()}
+    return json.dumps(obj)
+
+
+def create_opcode_mismatch_finder(
+        exec_sections_2: List[code_files.CodeFileSection],
         mapper_1: lib_address_maps.AddressMapper,
         mapper_2: lib_address_maps.AddressMapper,
-        *,
-        limit: int = None,
-        ignore_ranges: List[range] = (),
-        initial_num_warnings: int = 0) -> None:
+        ) -> Callable[[Iterable[Tuple[int, int, code_files.CodeFileSection]]], Iterator[Mismatch]]:
     """
-    Do the opcode comparison stuff
+    Return a function that compares the instructions in (start, stop,
+    section) ranges of addresses from code file 1 against code file 2,
+    and yields each mismatch.
+    This involves keeping instruction-name and section caches in a
+    closure.
     """
-
     error_handling = lib_address_maps.UnmappedAddressHandling(
         common.ErrorVolume.SILENT,
         lib_address_maps.UnmappedAddressHandling.Behavior.DROP)
 
     get_inst_name = create_instruction_name_lookup_func()
 
-    all_sections_1 = list(code_file_1.sections)
-    for rel_name, rel in rels_1:
-        all_sections_1.extend(rel.sections)
+    find_exec_section_containing_2 = create_section_lookup_func(exec_sections_2)
 
-    all_sections_2 = list(code_file_2.sections)
-    for rel_name, rel in rels_2:
-        all_sections_2.extend(rel.sections)
+    # Decoding a whole section's instructions at once (the first time
+    # it's needed) is a lot faster than slicing out and decoding each
+    # instruction separately
+    # {id(section): [inst_name, ...], ...}
+    section_inst_names = {}
 
-    num_warnings_printed = initial_num_warnings
-    if limit is not None and num_warnings_printed >= limit:
-        return
+    def get_inst_name_at(section: code_files.CodeFileSection, offset: int) -> str:
+        """
+        Get the name of the instruction at some offset in a section
+        """
+        inst_names = section_inst_names.get(id(section))
+        if inst_names is None:
+            inst_names = list(map(get_inst_name,
+                struct.unpack_from(f'>{len(section.data) // 4}I', section.data)))
+            section_inst_names[id(section)] = inst_names
+
+        if offset & 3 == 0 and offset >> 2 < len(inst_names):
+            return inst_names[offset >> 2]
+        else:
+            # Misaligned, or a partial instruction at the end
+            return get_inst_name(read_u32(section.data, offset))
 
-    for address_1, section_1 in iter_addresses_from_sections(
-            all_sections_1, executable=True, align_to=4, ignore_ranges=ignore_ranges):
-        offset_1 = address_1 - section_1.address
+    def iter_opcode_mismatches(
+            address_ranges: Iterable[Tuple[int, int, code_files.CodeFileSection]]) -> Iterator[Mismatch]:
+        """
+        Iterate over mismatches for some ranges of addresses
+        """
+        # Consecutive instructions nearly always map into the same
+        # section, so remember the last one and only search again when
+        # we leave it
+        section_2 = None
+        section_2_start = section_2_end = 0
+
+        for start_1, stop_1, section_1 in address_ranges:
+            # There were a few cases where they added something to the
+            # start of a function, so the symbol should map one way but
+            # the instructions map differently. As a convention, I
+            # mapped address+1 by instruction in these cases. So, we map
+            # address_1+1 here and subtract 1, instead of just mapping
+            # address_1.
+            # The address map is piecewise-linear, so this is done for
+            # whole runs of addresses at once rather than one at a time.
+            for run_start, run_stop, delta in lib_address_maps.map_range_from_to(
+                    mapper_1, mapper_2, start_1 + 1, stop_1 + 1, error_handling=error_handling):
+                if delta is None:
+                    continue
 
-        # There were a few cases where they added something to the start
-        # of a function, so the symbol should map one way but the
-        # instructions map differently. As a convention, I mapped
-        # address+1 by instruction in these cases. So, we map
-        # address_1+1 here and subtract 1, instead of just mapping
-        # address_1.
+                address_1 = (run_start - 1 + 3) & ~3
+                while address_1 < run_stop - 1:
+                    address_2 = address_1 + delta
+
+                    if not section_2_start <= address_2 < section_2_end:
+                        section_2 = find_exec_section_containing_2(address_2)
+                        if section_2 is None:
+                            section_2_start = section_2_end = 0
+                        else:
+                            section_2_start = section_2.address
+                            section_2_end = section_2.address + section_2.size
+
+                    if section_2 is None:
+                        yield address_1, address_2, None, None
+                        address_1 += 4
+                        continue
+
+                    # Everything up to the end of the run or of
+                    # section_2 (whichever comes first) maps into
+                    # section_2 with the same delta
+                    window_stop = min(run_stop - 1, section_2_end - delta)
+
+                    # Identical instruction words always have identical
+                    # opcodes, so compare the raw bytes first, and only
+                    # look up names for the words that actually differ
+                    window_size = (window_stop - address_1 + 3) & ~3
+                    window_offset_1 = address_1 - section_1.address
+                    window_offset_2 = address_2 - section_2_start
+                    window_1 = section_1.data[window_offset_1 : window_offset_1 + window_size]
+                    window_2 = section_2.data[window_offset_2 : window_offset_2 + window_size]
+
+                    if window_1 == window_2 and len(window_1) == window_size:
+                        relative_offsets = ()
+                    elif len(window_1) == len(window_2) == window_size:
+                        relative_offsets = iter_differing_words(window_1, window_2)
+                    else:
+                        # Partial instruction(s) at the end of a section
+                        relative_offsets = range(0, window_size, 4)
+
+                    for relative_offset in relative_offsets:
+                        inst_name_1 = get_inst_name_at(section_1, window_offset_1 + relative_offset)
+                        inst_name_2 = get_inst_name_at(section_2, window_offset_2 + relative_offset)
+
+                        if inst_name_1 != inst_name_2:
+                            yield address_1 + relative_offset, address_2 + relative_offset, inst_name_1, inst_name_2
+
+                    address_1 += window_size
+
+    return iter_opcode_mismatches
+
+
+def create_data_mismatch_finder(
+        all_sections_1: List[code_files.CodeFileSection],
+        all_sections_2: List[code_files.CodeFileSection],
+        mapper_1: lib_address_maps.AddressMapper,
+        mapper_2: lib_address_maps.AddressMapper,
+        *,
+        ignore_pointers: bool = False,
+        ) -> Callable[[Iterable[Tuple[int, int, code_files.CodeFileSection]]],
+            Iterator[Mismatch]]:
+    """
+    Return a function that compares the data in (start, stop, section)
+    ranges of addresses from code file 1 against code file 2, and yields
+    each mismatch. Runs of mismatched bytes aren't consolidated with
+    adjacent runs yet.
+    This involves keeping section and pointer caches in a closure.
+    """
+    error_handling = lib_address_maps.UnmappedAddressHandling(
+        common.ErrorVolume.SILENT,
+        lib_address_maps.UnmappedAddressHandling.Behavior.DROP)
 
-        address_2 = lib_address_maps.map_addr_from_to(mapper_1, mapper_2, address_1+1, error_handling=error_handling)
-        if address_2 is None:
-            continue
-        address_2 -= 1
+    looks_like_pointer_1 = create_pointer_check_func(all_sections_1)
+    looks_like_pointer_2 = create_pointer_check_func(all_sections_2)
 
-        section_2 = find_section_containing(address_2, all_sections_2, executable=True)
-        if section_2 is None:
-            print(f"{address_1:08x} -> {address_2:08x}: mapped address isn't in any section in code file 2")
+    # Only non-executable sections are compared (the checks above are
+    # for potential pointers, which can point into any section)
+    data_sections_2 = [s for s in all_sections_2 if not s.is_executable]
+    find_data_section_containing_2 = create_section_lookup_func(data_sections_2)
 
-            num_warnings_printed += 1
-            if limit is not None and num_warnings_printed >= limit:
-                break
+    # Every mismatched byte in a word checks the same potential pointer
+    # value (and the same pointers tend to show up over and over), so
+    # cache the results of mapping those
+    # {value_1: mapped_value_1, ...}
+    mapped_values = {}
+
+    def is_mismatch_explained(
+            section_1: code_files.CodeFileSection, section_2: code_files.CodeFileSection,
+            aligned_offset_1: int, aligned_offset_2: int) -> bool:
+        """
+        Check if a mismatch in the words at the given offsets can be
+        explained by them being pointers
+        """
+        aligned_value_1 = read_u32(section_1.data, aligned_offset_1)
+        if section_2.data is None:
+            aligned_value_2 = 0
+        else:
+            aligned_value_2 = read_u32(section_2.data, aligned_offset_2)
+
+        if ignore_pointers:
+            # With this flag, "forgive" the mismatch if it looks like a
+            # pointer on both sides (i.e. we can identify which sections
+            # they'd point to)
+            return looks_like_pointer_1(aligned_value_1) and looks_like_pointer_2(aligned_value_2)
+
+        else:
+            if aligned_value_1 in mapped_values:
+                hypothetical_mapped_addr = mapped_values[aligned_value_1]
             else:
-                continue
+                hypothetical_mapped_addr = mapped_values[aligned_value_1] = lib_address_maps.map_addr_from_to(
+                    mapper_1, mapper_2, aligned_value_1, error_handling=error_handling)
+            return hypothetical_mapped_addr is not None and hypothetical_mapped_addr == aligned_value_2
+
+    def iter_data_mismatches(
+            address_ranges: Iterable[Tuple[int, int, code_files.CodeFileSection]],
+            ) -> Iterator[Mismatch]:
+        """
+        Iterate over mismatches for some ranges of addresses
+        """
+        # Rather than mapping and comparing one byte at a time, map
+        # whole ranges of addresses at once, and compare everything
+        # that lands in the same section in code file 2 as a single
+        # slice. Only the mismatched bytes are looked at individually.
+        for start_1, stop_1, section_1 in address_ranges:
+            for run_start, run_stop, delta in lib_address_maps.map_range_from_to(
+                    mapper_1, mapper_2, start_1, stop_1, error_handling=error_handling):
+                if delta is None:
+                    continue
 
-        offset_2 = address_2 - section_2.address
+                address_1 = run_start
+                while address_1 < run_stop:
+                    address_2 = address_1 + delta
 
-        inst_1 = int.from_bytes(section_1.data[offset_1 : offset_1+4], 'big')
-        inst_2 = int.from_bytes(section_2.data[offset_2 : offset_2+4], 'big')
+                    section_2 = find_data_section_containing_2(address_2)
 
-        inst_name_1 = get_inst_name(inst_1)
-        inst_name_2 = get_inst_name(inst_2)
+                    if section_2 is None:
+                        yield address_1, address_2, None, None
+                        address_1 += 1
+                        continue
 
-        if inst_name_1 != inst_name_2:
-            print(f'{address_1:08x} -> {address_2:08x}: {inst_name_1} -> {inst_name_2}')
-            num_warnings_printed += 1
+                    window_stop = min(run_stop, section_2.address + section_2.size - delta)
+                    window_size = window_stop - address_1
+
+                    window_offset_1 = address_1 - section_1.address
+                    window_offset_2 = address_2 - section_2.address
+
+                    window_1 = section_1.data[window_offset_1 : window_offset_1 + window_size]
+                    if section_2.data is None:
+                        window_2 = bytes(window_size)
+                    else:
+                        window_2 = section_2.data[window_offset_2 : window_offset_2 + window_size]
+
+                    address_1 = window_stop
+
+                    if window_1 == window_2:
+                        continue
+
+                    def window_run(start: int, stop: int) -> Mismatch:
+                        return (section_1.address + window_offset_1 + start, section_2.address + window_offset_2 + start,
+                            window_1[start:stop], window_2[start:stop])
+
+                    for diff_start, diff_stop in iter_differing_runs(window_1, window_2):
+                        # Mismatched bytes in the same word are all
+                        # explained (or not) together, so only check
+                        # once per word, and yield the unexplained parts
+                        # of the run in as few pieces as possible
+                        unexplained_start = None
+                        prev_aligned_offsets = None
+                        is_explained = False
+                        for i in range(diff_start, diff_stop):
+                            aligned_offsets = ((window_offset_1 + i) & ~3, (window_offset_2 + i) & ~3)
+                            if aligned_offsets != prev_aligned_offsets:
+                                is_explained = is_mismatch_explained(section_1, section_2, *aligned_offsets)
+                                prev_aligned_offsets = aligned_offsets
+
+                            if is_explained:
+                                if unexplained_start is not None:
+                                    yield window_run(unexplained_start, i)
+                                    unexplained_start = None
+                            elif unexplained_start is None:
+                                unexplained_start = i
+
+                        if unexplained_start is not None:
+                            yield window_run(unexplained_start, diff_stop)
+
+    return iter_data_mismatches
+
+
+def iter_consolidated_mismatches(mismatches: Iterable[Mismatch]) -> Iterator[Mismatch]:
+    """
+    Iterate over mismatches, consolidating consecutive mismatched
+    runs into single mismatches
+    """
+    # The runs are kept as lists of pieces, and only joined together
+    # when the mismatch ends, so nothing is copied more than once.
+    # (They can't just be sliced out of the section data afterward,
+    # since a mismatch can cross section boundaries)
+    running_address_1 = None
+    running_pieces_1 = None
+    running_stop_1 = None
+    running_address_2 = None
+    running_pieces_2 = None
+    running_stop_2 = None
+
+    for mismatch in mismatches:
+        address_1, address_2, bytes_1, bytes_2 = mismatch
+        if bytes_1 is None:
+            # Unmapped address -- pass it straight through
+            yield mismatch
+            continue
+
+        if address_1 == running_stop_1 and address_2 == running_stop_2:
+            # Continue the current mismatch
+            running_pieces_1.append(bytes_1)
+            running_pieces_2.append(bytes_2)
+        else:
+            if running_address_1 is not None:
+                # Previous mismatch has ended
+                yield running_address_1, running_address_2, b''.join(running_pieces_1), b''.join(running_pieces_2)
+
+            # Start a new one
+            running_address_1 = address_1
+            running_pieces_1 = [bytes_1]
+            running_address_2 = address_2
+            running_pieces_2 = [bytes_2]
+
+        running_stop_1 = address_1 + len(bytes_1)
+        running_stop_2 = address_2 + len(bytes_2)
+
+    if running_address_1 is not None:
+        yield running_address_1, running_address_2, b''.join(running_pieces_1), b''.join(running_pieces_2)
+
+
+# Sizes of the pieces that the comparisons are split into, when they're
+# spread across multiple processes
+OPCODE_COMPARISON_CHUNK_SIZE = 0x10000
+DATA_COMPARISON_CHUNK_SIZE = 0x10000
+
+# Per-process state for _find_mismatches_in_subprocess()
+_subprocess_sections_1 = None
+_subprocess_find_mismatches = None
+_subprocess_consolidate = None
+
+
+def _init_comparison_subprocess(
+        sections_1: List[code_files.CodeFileSection],
+        create_finder: Callable[[], Callable[[Iterable[Tuple[int, int, code_files.CodeFileSection]]], Iterator[Mismatch]]],
+        consolidate: Optional[Callable[[Iterable[Mismatch]], Iterator[Mismatch]]]) -> None:
+    """
+    Initializer for print_mismatches_in_chunks()'s worker processes, so
+    the sections and mappers only need to be sent over once per process
+    instead of once per chunk
+    """
+    global _subprocess_sections_1, _subprocess_find_mismatches, _subprocess_consolidate
+    _subprocess_sections_1 = sections_1
+    _subprocess_find_mismatches = create_finder()
+    _subprocess_consolidate = consolidate
+
+
+def _find_mismatches_in_subprocess(
+        start: int, stop: int, section_index: int, limit: Optional[int]) -> List[Mismatch]:
+    """
+    Worker function for print_mismatches_in_chunks(). Returns the
+    mismatches for one range of addresses (only as many as could
+    possibly be printed, if limit isn't None).
+    """
+    section = _subprocess_sections_1[section_index]
+    mismatches = _subprocess_find_mismatches([(start, stop, section)])
+
+    if _subprocess_consolidate is not None:
+        mismatches = _subprocess_consolidate(mismatches)
+        # The first one might still be merged into the end of the
+        # previous chunk's last one, so allow for one more
+        if limit is not None:
+            limit += 1
+
+    return list(itertools.islice(mismatches, limit))
+
+
+def print_mismatches_in_chunks(
+        address_ranges: List[Tuple[int, int, code_files.CodeFileSection]],
+        sections_1: List[code_files.CodeFileSection],
+        create_finder: Callable[[], Callable[[Iterable[Tuple[int, int, code_files.CodeFileSection]]], Iterator[Mismatch]]],
+        *,
+        consolidate: Optional[Callable[[Iterable[Mismatch]], Iterator[Mismatch]]] = None,
+        chunk_size: int,
+        limit: Optional[int],
+        num_warnings_printed: int,
+        workers: int,
+        json_lines: bool) -> int:
+    """
+    Find and print the mismatches in some (start, stop, section) ranges
+    of addresses from code file 1 (with each section in sections_1),
+    and return the updated number of warnings printed.
+    create_finder() should return a finder function, like
+    create_opcode_mismatch_finder() does. If given, consolidate() is
+    used to merge adjacent mismatches.
+    If workers is more than 1, the work is split across that many
+    processes, so create_finder and consolidate need to be picklable.
+    """
+    format_warning = format_mismatch_json if json_lines else format_mismatch
+
+    def print_warnings(warnings: Iterable[Mismatch]) -> None:
+        """
+        Print warnings until we run out or reach the limit
+        """
+        nonlocal num_warnings_printed
+
+        if consolidate is not None:
+            warnings = consolidate(warnings)
+
+        for warning in warnings:
+            print(format_warning(warning))
 
             num_warnings_printed += 1
             if limit is not None and num_warnings_printed >= limit:
                 break
 
+    # Split the ranges up into evenly sized chunks, so there's something
+    # to spread across the processes even if there's only one big
+    # section
+    chunks = []
+    if workers > 1:
+        section_indices = {id(section): i for i, section in enumerate(sections_1)}
+        for start, stop, section in address_ranges:
+            for chunk_start in range(start, stop, chunk_size):
+                chunks.append((
+                    chunk_start,
+                    min(stop, chunk_start + chunk_size),
+                    section_indices[id(section)]))
+
+    if len(chunks) <= 1:
+        print_warnings(create_finder()(address_ranges))
+
+    else:
+        # This is all pure Python, so use processes rather than threads
+        # to get around the GIL
+        with concurrent.futures.ProcessPoolExecutor(
+                min(workers, len(chunks)),
+                initializer=_init_comparison_subprocess,
+                initargs=(sections_1, create_finder, consolidate)) as executor:
+
+            # No chunk can contribute more warnings than we have room
+            # left for
+            chunk_limit = None if limit is None else limit - num_warnings_printed
+
+            results = executor.map(
+                _find_mismatches_in_subprocess,
+                *zip(*chunks),
+                itertools.repeat(chunk_limit))
+
+            # (Results come back in order, and are consolidated again
+            # here across chunk boundaries, so the output is the same as
+            # if this were done in a single process)
+            print_warnings(itertools.chain.from_iterable(results))
+
+            # If we stopped early, don't bother with the remaining chunks
+            executor.shutdown(cancel_futures=True)
+
     if limit is not None and num_warnings_printed >= limit:
-        print(f'Reached user-selected limit of {limit} warnings -- stopping here')
+        # (Kept out of the JSON Lines output, so it stays parseable)
+        print(f'Reached user-selected limit of {limit} warnings -- stopping here',
+            file=sys.stderr if json_lines else sys.stdout)
 
     return num_warnings_printed
 
 
-def compare_data_across_versions(
+def compare_opcodes_across_versions(
         code_file_1: code_files.CodeFile,
         code_file_2: code_files.CodeFile,
         rels_1: List[code_files_rel.REL],
@@ -500,18 +1067,17 @@ def compare_data_across_versions(
         mapper_1: lib_address_maps.AddressMapper,
         mapper_2: lib_address_maps.AddressMapper,
         *,
-        limit: int = None,
-        ignore_pointers: bool = False,
+        limit: Optional[int] = None,
         ignore_ranges: List[range] = (),
-        initial_num_warnings: int = 0) -> None:
+        initial_num_warnings: int = 0,
+        workers: int = 1,
+        json_lines: bool = False) -> int:
     """
-    Do the data comparison stuff
+    Do the opcode comparison stuff, and return the total number of
+    warnings printed so far (including initial_num_warnings).
+    If workers is more than 1, the work is split across that many
+    processes.
     """
-
-    error_handling = lib_address_maps.UnmappedAddressHandling(
-        common.ErrorVolume.SILENT,
-        lib_address_maps.UnmappedAddressHandling.Behavior.DROP)
-
     all_sections_1 = list(code_file_1.sections)
     for rel_name, rel in rels_1:
         all_sections_1.extend(rel.sections)
@@ -520,116 +1086,67 @@ def compare_data_across_versions(
     for rel_name, rel in rels_2:
         all_sections_2.extend(rel.sections)
 
-    num_warnings_printed = initial_num_warnings
-    if limit is not None and num_warnings_printed >= limit:
-        return
-
-    def iter_mismatched_bytes() -> Iterator[Tuple[int, bytes, int, bytes]]:
-        """
-        Iterate over (address_1, byte_1, address_2, byte_2) tuples
-        """
-        nonlocal num_warnings_printed
-
-        for address_1, section_1 in iter_addresses_from_sections(
-                all_sections_1, executable=False, ignore_ranges=ignore_ranges):
-            offset_1 = address_1 - section_1.address
-
-            address_2 = lib_address_maps.map_addr_from_to(mapper_1, mapper_2, address_1, error_handling=error_handling)
-            if address_2 is None:
-                continue
-
-            section_2 = find_section_containing(address_2, all_sections_2, executable=False)
-
-            if section_2 is None:
-                print(f"{address_1:08x} -> {address_2:08x}: mapped address isn't in any section in code file 2")
-
-                num_warnings_printed += 1
-                if limit is not None and num_warnings_printed >= limit:
-                    break
-                else:
-                    continue
-
-            offset_2 = address_2 - section_2.address
-
-            byte_1 = section_1.data[offset_1] if section_1.data is not None else 0
-            byte_2 = section_2.data[offset_2] if section_2.data is not None else 0
-
-            if byte_1 != byte_2:
+    # Only executable sections matter here
+    exec_sections_1 = [s for s in all_sections_1 if s.is_executable]
+    exec_sections_2 = [s for s in all_sections_2 if s.is_executable]
 
-                # Maybe it's part of an address!
-                aligned_offset_1 = offset_1 & ~3
-                aligned_offset_2 = offset_2 & ~3
-                if section_1.data is None:
-                    aligned_value_1 = 0
-                else:
-                    aligned_value_1 = int.from_bytes(section_1.data[aligned_offset_1 : aligned_offset_1+4], 'big')
-                if section_2.data is None:
-                    aligned_value_2 = 0
-                else:
-                    aligned_value_2 = int.from_bytes(section_2.data[aligned_offset_2 : aligned_offset_2+4], 'big')
+    if limit is not None and initial_num_warnings >= limit:
+        return initial_num_warnings
 
-                is_mismatch_explained = False
+    return print_mismatches_in_chunks(
+        list(iter_address_ranges_from_sections(exec_sections_1, ignore_ranges=ignore_ranges)),
+        exec_sections_1,
+        functools.partial(create_opcode_mismatch_finder, exec_sections_2, mapper_1, mapper_2),
+        chunk_size=OPCODE_COMPARISON_CHUNK_SIZE,
+        limit=limit,
+        num_warnings_printed=initial_num_warnings,
+        workers=workers,
+        json_lines=json_lines)
 
-                if ignore_pointers:
-                    # With this flag, "forgive" the mismatch if it looks
-                    # like a pointer on both sides (i.e. we can identify
-                    # which sections they'd point to)
-                    is_mismatch_explained = (find_section_containing(aligned_value_1, all_sections_1) is not None
-                        and find_section_containing(aligned_value_2, all_sections_2) is not None)
 
-                else:
-                    hypothetical_mapped_addr = lib_address_maps.map_addr_from_to(
-                        mapper_1, mapper_2, aligned_value_1, error_handling=error_handling)
-                    is_mismatch_explained = (hypothetical_mapped_addr is not None
-                        and hypothetical_mapped_addr == aligned_value_2)
-
-                if not is_mismatch_explained:
-                    yield address_1, bytes([byte_1]), address_2, bytes([byte_2])
-
-    def iter_consolidated_mismatched_bytes() -> Iterator[Tuple[int, bytes, int, bytes]]:
-        """
-        Iterate over (address_1, bytes_1, address_2, bytes_2) tuples,
-        i.e. consolidate consecutive mismatched bytes into bytestrings
-        """
-        running_address_1 = None
-        running_bytes_1 = None
-        running_address_2 = None
-        running_bytes_2 = None
-        for address_1, byte_1, address_2, byte_2 in iter_mismatched_bytes():
-            if running_address_1 is None:
-                # No running mismatch yet -- start one
-                running_address_1 = address_1
-                running_bytes_1 = bytearray(byte_1)
-                running_address_2 = address_2
-                running_bytes_2 = bytearray(byte_2)
-            elif address_1 == running_address_1 + len(running_bytes_1) \
-                    and address_2 == running_address_2 + len(running_bytes_2):
-                # Continue the current mismatch
-                running_bytes_1 += byte_1
-                running_bytes_2 += byte_2
-            else:
-                # Previous mismatch has ended
-                yield running_address_1, bytes(running_bytes_1), running_address_2, bytes(running_bytes_2)
-                running_address_1 = address_1
-                running_bytes_1 = bytearray(byte_1)
-                running_address_2 = address_2
-                running_bytes_2 = bytearray(byte_2)
+def compare_data_across_versions(
+        code_file_1: code_files.CodeFile,
+        code_file_2: code_files.CodeFile,
+        rels_1: List[code_files_rel.REL],
+        rels_2: List[code_files_rel.REL],
+        mapper_1: lib_address_maps.AddressMapper,
+        mapper_2: lib_address_maps.AddressMapper,
+        *,
+        limit: int = None,
+        ignore_pointers: bool = False,
+        ignore_ranges: List[range] = (),
+        initial_num_warnings: int = 0,
+        workers: int = 1,
+        json_lines: bool = False) -> None:
+    """
+    Do the data comparison stuff.
+    If workers is more than 1, the work is split across that many
+    processes.
+    """
+    all_sections_1 = list(code_file_1.sections)
+    for rel_name, rel in rels_1:
+        all_sections_1.extend(rel.sections)
 
-        if running_address_1 is not None:
-            yield running_address_1, bytes(running_bytes_1), running_address_2, bytes(running_bytes_2)
+    all_sections_2 = list(code_file_2.sections)
+    for rel_name, rel in rels_2:
+        all_sections_2.extend(rel.sections)
 
-    for address_1, bytes_1, address_2, bytes_2 in iter_consolidated_mismatched_bytes():
-        print(f'{address_1:08x} -> {address_2:08x}: {bytes(bytes_1)} -> {bytes(bytes_2)}')
+    data_sections_1 = [s for s in all_sections_1 if not s.is_executable]
 
-        num_warnings_printed += 1
-        if limit is not None and num_warnings_printed >= limit:
-            break
+    if limit is not None and initial_num_warnings >= limit:
+        return
 
-    # We keep this separate because iter_consolidated_mismatched_bytes()
-    # *also* modifies and monitors num_warnings_printed, and exits early
-    # if it's the first to see it go over the limit
-    if limit is not None and num_warnings_printed >= limit:
-        print(f'Reached user-selected limit of {limit} warnings -- stopping here')
+    print_mismatches_in_chunks(
+        list(iter_address_ranges_from_sections(data_sections_1, ignore_ranges=ignore_ranges)),
+        data_sections_1,
+        functools.partial(create_data_mismatch_finder,
+            all_sections_1, all_sections_2, mapper_1, mapper_2, ignore_pointers=ignore_pointers),
+        consolidate=iter_consolidated_mismatches,
+        chunk_size=DATA_COMPARISON_CHUNK_SIZE,
+        limit=limit,
+        num_warnings_printed=initial_num_warnings,
+        workers=workers,
+        json_lines=json_lines)
 
 
 def main(args: Optional[List[str]] = None) -> None:
@@ -656,6 +1173,10 @@ def main(args: Optional[List[str]] = None) -> None:
         help="in data sections, ignore any mismatched bytes that look like pointers (useful while you're still writing the address map and there are forward references) (inclusive on both ends, same as in address map files)")
     parser.add_argument('--ignore-range', action='append',
         help='a range of addresses (relative to the first code file) to ignore')
+    parser.add_argument('--json', action='store_true',
+        help='print warnings as JSON Lines (one JSON object per line) instead of text, for use by other tools')
+    parser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+        help='split the comparisons across N processes (default: 1)')
 
     for num in [1, 2]:
         parser.add_argument(f'--rel-{num}', nargs=2, action='append', metavar=('REL', 'ADDRS'),
@@ -665,11 +1186,31 @@ def main(args: Optional[List[str]] = None) -> None:
 
     parsed_args = parser.parse_args(args)
 
+    if parsed_args.no_check_text and parsed_args.no_check_data:
+        # Nothing to compare, so don't bother loading anything
+        return
+
     with parsed_args.address_map.open('r', encoding='utf-8') as f:
         mappers = lib_address_maps.load_address_map(f)
 
     def load_code_file(path: Path) -> code_files.CodeFile:
-        cf = code_files_all.load_by_extension(path.read_bytes(), path.suffix)
+        # Memory-map the file rather than reading it all in, since the
+        # loaders copy out the section data anyway, and the rest of the
+        # file doesn't need to be kept in memory
+        with path.open('rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty file, or not something that can be mapped
+                data = f.read()
+
+        cf = code_files_all.load_by_extension(data, path.suffix)
+        if isinstance(data, mmap.mmap):
+            # The sections have all been copied out of it by now, and
+            # nothing reads cf.data after loading, so it doesn't need to
+            # stay open for the rest of the run
+            data.close()
+
         if cf is not None:
             lib_nsmbw.auto_assign_alf_section_executability(cf)
             return cf
@@ -713,11 +1254,12 @@ def main(args: Optional[List[str]] = None) -> None:
 
     ignore_ranges = []
     if parsed_args.ignore_range is not None:
+        range_regex = re.compile(r'^\s*(?:0x)?([a-fA-F0-9]+)\s*-\s*(?:0x)?([a-fA-F0-9]+)\s*$')
         for range_str in parsed_args.ignore_range:
-            if range_str.count('-') != 1:
+            match = range_regex.match(range_str)
+            if match is None:
                 raise ValueError(f'Address range "{range_str}" has invalid format')
-            range_vals = [int(v, 16) for v in range_str.split('-')]
-            ignore_ranges.append(range(range_vals[0], range_vals[1] + 1))
+            ignore_ranges.append(range(int(match[1], 16), int(match[2], 16) + 1))
 
     num_warnings_so_far = 0
 
@@ -728,7 +1270,9 @@ def main(args: Optional[List[str]] = None) -> None:
             mappers[parsed_args.name_1], mappers[parsed_args.name_2],
             limit=parsed_args.limit,
             ignore_ranges=ignore_ranges,
-            initial_num_warnings=num_warnings_so_far)
+            initial_num_warnings=num_warnings_so_far,
+            workers=parsed_args.jobs,
+            json_lines=parsed_args.json)
 
     if not parsed_args.no_check_data:
         compare_data_across_versions(
@@ -738,7 +1282,9 @@ def main(args: Optional[List[str]] = None) -> None:
             limit=parsed_args.limit,
             ignore_pointers=parsed_args.ignore_data_pointers,
             ignore_ranges=ignore_ranges,
-            initial_num_warnings=num_warnings_so_far)
+            initial_num_warnings=num_warnings_so_far,
+            workers=parsed_args.jobs,
+            json_lines=parsed_args.json)
 
 
 if __name__ == '__main__':